@@ -4,10 +4,23 @@ export interface MapResponse {
   radius_km: number;
   start_date: string;
   end_date: string;
-  map_data: Record<string, number[][]>;
+  map_data: Record<string, number[][] | MapGrid>;
   products: Record<string, ProductStats>;
 }
 
+// map_data of a product requested with format=grid: a row-major
+// latitude x longitude grid of base64 little-endian float32 values,
+// NaN for cells without data. Cell (i, j) is at origin + (i, j) * step.
+export interface MapGrid {
+  origin: [number | null, number | null];
+  step: [number, number];
+  shape: [number, number];
+  dtype: 'float32';
+  values: string;
+  latitude?: number[];
+  longitude?: number[];
+}
+
 export interface ProductStats {
   mean_value: number;
   min_value: number;
@@ -2,7 +2,7 @@ import { Injectable } from '@angular/core';
 
 
 import { Observable } from 'rxjs';
-import { MapResponse } from '../../_model/map'
+import { MapGrid, MapResponse } from '../../_model/map'
 
 //import { of } from 'rxjs';
 //import { MOCK_MAP_RESPONSE } from '../map/mock-map';
@@ -18,16 +18,41 @@ export class MapService {
   public getCurrentMap(lat: number, lon: number): Observable<MapResponse> {
     const params = new HttpParams()
       .set('lat', lat)
-      .set('lon', lon);
+      .set('lon', lon)
+      .set('format', 'grid');
 
     return this.http.get<MapResponse>(`/api/map/current`, { params });
   }
 
+  // Heat points [lat, lon, value] of each product
   public processMapData(res: MapResponse): Record<string, number[][]> {
     const swappedData: Record<string, number[][]> = {};
     for (const key in res.map_data) {
-      swappedData[key] = res.map_data[key].map(([lat, lon, val]) => [lon, lat, val]);
+      const data = res.map_data[key];
+      swappedData[key] = Array.isArray(data)
+        ? data.map(([lon, lat, val]) => [lat, lon, val])
+        : this.gridToPoints(data);
     }
     return swappedData;
   }
+
+  private gridToPoints(grid: MapGrid): number[][] {
+    const [rows, cols] = grid.shape;
+    const [lat0, lon0] = grid.origin;
+    const [latStep, lonStep] = grid.step;
+    const bytes = Uint8Array.from(atob(grid.values), c => c.charCodeAt(0));
+    const view = new DataView(bytes.buffer);
+
+    const points: number[][] = [];
+    for (let i = 0; i < rows; i++) {
+      const lat = grid.latitude ? grid.latitude[i] : lat0! + i * latStep;
+      for (let j = 0; j < cols; j++) {
+        const val = view.getFloat32((i * cols + j) * 4, true);
+        if (Number.isNaN(val)) continue;
+        const lon = grid.longitude ? grid.longitude[j] : lon0! + j * lonStep;
+        points.push([lat, lon, val]);
+      }
+    }
+    return points;
+  }
 }
@@ -0,0 +1,169 @@
+"""
+Cache backend for the NASA proxy.
+
+Wraps Redis with a shared connection pool, lazy reconnects with backoff and a
+bounded in-process LRU tier. Hot keys are served without a network round
+trip, and a Redis outage degrades to local caching instead of disabling the
+cache.
+"""
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+import redis
+
+logger = logging.getLogger(__name__)
+
+
+class LocalCache:
+    """Bounded in-process LRU of encoded cache entries, sized in bytes"""
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at is not None and time.monotonic() >= expires_at:
+                self._remove(key)
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=None):
+        """Store a value for ttl seconds (forever if None), evicting the least recently used"""
+        if len(value) > self.max_bytes:
+            return
+        expires_at = None if ttl is None else time.monotonic() + ttl
+        with self._lock:
+            self._remove(key)
+            self._entries[key] = (value, expires_at)
+            self._size += len(value)
+            while self._size > self.max_bytes:
+                _, (evicted, _) = self._entries.popitem(last=False)
+                self._size -= len(evicted)
+
+    def _remove(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._size -= len(entry[0])
+
+
+class CacheBackend:
+    """
+    Redis cache with an in-process LRU tier in front of it.
+
+    Connections come from a shared pool and are only opened when first
+    needed. After a connection error Redis is skipped for an exponentially
+    growing backoff, during which reads and writes only use the local tier.
+    Local copies of Redis entries live at most local_ttl seconds, which
+    bounds how long a worker can miss an update made by another one.
+    """
+
+    def __init__(self, host, port, db=0, max_connections=50, socket_timeout=5,
+                 local_max_bytes=64 * 1024 * 1024, local_ttl=60,
+                 backoff_base=1, backoff_max=60):
+        self.pool = redis.ConnectionPool(
+            host=host,
+            port=port,
+            db=db,
+            max_connections=max_connections,
+            socket_connect_timeout=socket_timeout,
+            socket_timeout=socket_timeout,
+        )
+        self.client = redis.Redis(connection_pool=self.pool)
+        self.local = LocalCache(local_max_bytes)
+        self.local_ttl = local_ttl
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self._failures = 0
+        self._retry_at = 0.0
+        self._state_lock = threading.Lock()
+
+    @property
+    def available(self):
+        """Whether Redis should be tried, i.e. it is not in a reconnect backoff"""
+        return time.monotonic() >= self._retry_at
+
+    def _mark_down(self, error):
+        with self._state_lock:
+            self._failures += 1
+            backoff = min(self.backoff_max, self.backoff_base * 2 ** (self._failures - 1))
+            self._retry_at = time.monotonic() + backoff
+        logger.warning(f"Redis unavailable ({error}), retrying in {backoff}s. Using the local cache only.")
+
+    def _mark_up(self):
+        if self._failures == 0:
+            return
+        with self._state_lock:
+            self._failures = 0
+            self._retry_at = 0.0
+        logger.info("Reconnected to Redis")
+
+    def _call(self, operation, *args, default=None, **kwargs):
+        """Run a Redis operation, returning default if Redis is unavailable or fails"""
+        if not self.available:
+            return default
+        try:
+            result = operation(*args, **kwargs)
+        except (redis.exceptions.ConnectionError, redis.exceptions.TimeoutError) as e:
+            self._mark_down(e)
+            return default
+        except redis.exceptions.RedisError as e:
+            logger.error(f"Redis error: {e}")
+            return default
+        self._mark_up()
+        return result
+
+    def _get_with_ttl(self, key):
+        pipe = self.client.pipeline(transaction=False)
+        pipe.get(key)
+        pipe.pttl(key)
+        return pipe.execute()
+
+    def ping(self):
+        """Check the Redis connection, honouring the reconnect backoff"""
+        return bool(self._call(self.client.ping, default=False))
+
+    def get(self, key, local=True):
+        """Get the bytes stored for a key from the local tier or Redis, or from Redis only if not local"""
+        if local:
+            value = self.local.get(key)
+            if value is not None:
+                return value
+
+        result = self._call(self._get_with_ttl, key)
+        if result is None:
+            return None
+        value, ttl_ms = result
+        if value is not None:
+            ttl = self.local_ttl if ttl_ms < 0 else min(ttl_ms / 1000, self.local_ttl)
+            self.local.set(key, value, ttl)
+        return value
+
+    def set(self, key, value, expiry=None):
+        """Store bytes for expiry seconds (forever if None) in Redis and the local tier"""
+        stored = self._call(self.client.set, key, value, ex=expiry, default=False)
+        if stored:
+            local_ttl = self.local_ttl if expiry is None else min(expiry, self.local_ttl)
+        else:
+            # The local tier is the only copy until Redis is back
+            local_ttl = expiry
+        self.local.set(key, value, local_ttl)
+
+    def exists(self, key):
+        """Whether a key exists in Redis"""
+        return bool(self._call(self.client.exists, key, default=0))
+
+    def lock(self, name, **kwargs):
+        """A Redis lock, or None while Redis is unavailable"""
+        if not self.available:
+            return None
+        return self.client.lock(name, **kwargs)
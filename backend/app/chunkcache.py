@@ -0,0 +1,206 @@
+"""
+Local on-disk cache of remote granule byte ranges.
+
+Virtual datasets read the chunks of the remote TEMPO NetCDF granules with
+HTTP range requests. Files are split into fixed-size blocks, which are
+stored under a directory shared by every worker (the nasa_db volume in
+docker compose), so repeated reads of the same granule regions are served
+from local disk. The directory is bounded in size and the least recently
+used blocks are evicted.
+"""
+import asyncio
+import hashlib
+import logging
+import os
+import tempfile
+import threading
+
+from fsspec.implementations.http import HTTPFileSystem
+
+logger = logging.getLogger(__name__)
+
+TEMP_PREFIX = '.tmp-'
+
+
+class BlockStore:
+    """
+    Blocks of remote files stored on disk, keyed by URL and block index.
+
+    Granule files never change, so blocks never need to be invalidated.
+    Reads refresh the modification time of a block, which orders the LRU
+    eviction. Eviction runs in a background thread after every
+    sweep_fraction of max_bytes written, and any number of processes can
+    share the directory. All methods do blocking file I/O.
+    """
+
+    def __init__(self, directory, max_bytes, block_size=256 * 1024, sweep_fraction=0.05):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.block_size = block_size
+        self.sweep_bytes = max(int(max_bytes * sweep_fraction), block_size)
+        self._lock = threading.Lock()
+        # Sweep on the first write, in case the limit was lowered
+        self._written = self.sweep_bytes
+        self._write_failed = False
+        self._evicting = False
+        self._eviction_thread = None
+
+    def _path(self, url, index):
+        digest = hashlib.sha256(url.encode('utf-8')).hexdigest()
+        return os.path.join(self.directory, digest[:2], f"{digest}-{index}")
+
+    def get(self, url, index):
+        """Bytes of a block, or None if it is not stored"""
+        path = self._path(url, index)
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+        except FileNotFoundError:
+            return None
+        except OSError as e:
+            logger.warning(f"Error reading chunk cache block {path}: {e}")
+            return None
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return data
+
+    def put(self, url, index, data):
+        """Store a block, evicting old blocks once enough was written"""
+        path = self._path(url, index)
+        directory = os.path.dirname(path)
+        tmp_path = None
+        try:
+            os.makedirs(directory, exist_ok=True)
+            # Write then rename, so readers never see a partial block
+            fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=TEMP_PREFIX)
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            if not self._write_failed:
+                logger.warning(f"Chunk cache unavailable, reading from the network only: {e}")
+                self._write_failed = True
+            if tmp_path is not None:
+                try:
+                    os.remove(tmp_path)
+                except OSError:
+                    pass
+            return
+
+        with self._lock:
+            self._written += len(data)
+            sweep = self._written >= self.sweep_bytes and not self._evicting
+            if sweep:
+                self._written = 0
+                self._evicting = True
+        if sweep:
+            # Walking the whole cache is slow, keep it off the read path
+            self._eviction_thread = threading.Thread(
+                target=self._evict_in_background, name="chunk-cache-evict", daemon=True
+            )
+            self._eviction_thread.start()
+
+    def _evict_in_background(self):
+        try:
+            self.evict()
+        except OSError as e:
+            logger.warning(f"Error evicting chunk cache blocks: {e}")
+        finally:
+            with self._lock:
+                self._evicting = False
+
+    def evict(self):
+        """Delete the least recently used blocks while the cache is over 90% of max_bytes"""
+        entries = []
+        total = 0
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+                total += stat.st_size
+
+        if total <= self.max_bytes:
+            return
+
+        target = self.max_bytes * 0.9
+        evicted = 0
+        for _, size, path in sorted(entries):
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+            evicted += 1
+        logger.info(f"Evicted {evicted} chunk cache blocks")
+
+
+class CachedHTTPFileSystem(HTTPFileSystem):
+    """
+    HTTP filesystem serving byte range reads from a BlockStore.
+
+    Only the blocks missing from the store are downloaded, with one range
+    request per run of consecutive blocks. Whole-file reads bypass the
+    cache. Reads run on the shared fsspec event loop, so the store's
+    blocking file I/O runs in threads.
+
+    https is the first protocol, as a reference filesystem given a single
+    filesystem registers it under its first protocol only, and granule
+    references are https URLs.
+    """
+
+    protocol = ("https", "http")
+
+    def __init__(self, block_store, **storage_options):
+        super().__init__(**storage_options)
+        self.block_store = block_store
+
+    async def _cat_file(self, url, start=None, end=None, **kwargs):
+        if start is None or end is None or start < 0 or end <= start:
+            return await super()._cat_file(url, start=start, end=end, **kwargs)
+
+        block_size = self.block_store.block_size
+        first = start // block_size
+        last = (end - 1) // block_size
+
+        stored = await asyncio.to_thread(
+            lambda: [(index, self.block_store.get(url, index)) for index in range(first, last + 1)]
+        )
+        blocks = {index: data for index, data in stored if data is not None}
+        missing = [index for index, data in stored if data is None]
+
+        # Group the missing blocks into runs of consecutive ones
+        runs = []
+        for index in missing:
+            if runs and runs[-1][1] == index - 1:
+                runs[-1][1] = index
+            else:
+                runs.append([index, index])
+
+        for run_first, run_last in runs:
+            data = await super()._cat_file(
+                url, start=run_first * block_size, end=(run_last + 1) * block_size, **kwargs
+            )
+            fetched = []
+            for index in range(run_first, run_last + 1):
+                offset = (index - run_first) * block_size
+                block = data[offset:offset + block_size]
+                blocks[index] = block
+                # The last block of a file is shorter, past it there is nothing to keep
+                if block:
+                    fetched.append((index, block))
+            await asyncio.to_thread(
+                lambda: [self.block_store.put(url, index, block) for index, block in fetched]
+            )
+
+        data = b''.join(blocks[index] for index in range(first, last + 1))
+        offset = start - first * block_size
+        return data[offset:offset + end - start]
+
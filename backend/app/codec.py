@@ -0,0 +1,124 @@
+"""
+Binary codec for cached payloads.
+
+Payloads are JSON-like structures that may contain NumPy arrays. Arrays are
+stored as raw buffers next to a small JSON header that describes the rest of
+the structure, and the whole frame is compressed with zstd (or zlib when the
+zstandard package is not installed).
+"""
+import json
+import struct
+import zlib
+
+import numpy as np
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+MAGIC = b'NSA'
+VERSION = 1
+COMPRESSION_ZLIB = 0
+COMPRESSION_ZSTD = 1
+
+# Frame prefix: magic, version, compression
+FRAME_PREFIX = struct.Struct('>3sBB')
+HEADER_LENGTH = struct.Struct('>I')
+ARRAY_MARKER = '__ndarray__'
+
+
+def _compress(body, level):
+    if zstandard is not None:
+        return COMPRESSION_ZSTD, zstandard.ZstdCompressor(level=level).compress(body)
+    return COMPRESSION_ZLIB, zlib.compress(body, level)
+
+
+def _decompress(compression, body):
+    if compression == COMPRESSION_ZSTD:
+        if zstandard is None:
+            raise ValueError("Payload is zstd compressed but zstandard is not installed")
+        return zstandard.ZstdDecompressor().decompress(body)
+    if compression == COMPRESSION_ZLIB:
+        return zlib.decompress(body)
+    raise ValueError(f"Unknown compression: {compression}")
+
+
+def _pack(value, arrays):
+    """Replace the arrays in a structure with markers, collecting them"""
+    if isinstance(value, np.ndarray):
+        arrays.append(np.ascontiguousarray(value))
+        return {ARRAY_MARKER: len(arrays) - 1}
+    if isinstance(value, dict):
+        return {key: _pack(item, arrays) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_pack(item, arrays) for item in value]
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
+
+
+def _unpack(value, arrays):
+    """Replace the markers in a structure with their arrays"""
+    if isinstance(value, dict):
+        if ARRAY_MARKER in value and len(value) == 1:
+            return arrays[value[ARRAY_MARKER]]
+        return {key: _unpack(item, arrays) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_unpack(item, arrays) for item in value]
+    return value
+
+
+def is_encoded(payload):
+    """Whether a payload was produced by encode"""
+    return payload[:len(MAGIC)] == MAGIC
+
+
+def encode(data, level=3):
+    """Encode a JSON-like structure, possibly containing NumPy arrays, to bytes"""
+    arrays = []
+    structure = _pack(data, arrays)
+
+    descriptors = []
+    offset = 0
+    for array in arrays:
+        descriptors.append({
+            'dtype': array.dtype.str,
+            'shape': list(array.shape),
+            'offset': offset,
+        })
+        offset += array.nbytes
+
+    header = json.dumps({'data': structure, 'arrays': descriptors}).encode('utf-8')
+    body = b''.join([HEADER_LENGTH.pack(len(header)), header] + [array.tobytes() for array in arrays])
+
+    compression, compressed = _compress(body, level)
+    return FRAME_PREFIX.pack(MAGIC, VERSION, compression) + compressed
+
+
+def decode(payload):
+    """
+    Decode bytes produced by encode.
+
+    Raises ValueError if the payload is not a frame of this codec version.
+    Arrays are read-only views over the decompressed buffer.
+    """
+    if len(payload) < FRAME_PREFIX.size or not is_encoded(payload):
+        raise ValueError("Not an encoded payload")
+    _, version, compression = FRAME_PREFIX.unpack_from(payload)
+    if version != VERSION:
+        raise ValueError(f"Unsupported payload version: {version}")
+
+    body = _decompress(compression, payload[FRAME_PREFIX.size:])
+    (header_length,) = HEADER_LENGTH.unpack_from(body)
+    data_start = HEADER_LENGTH.size + header_length
+    header = json.loads(body[HEADER_LENGTH.size:data_start].decode('utf-8'))
+
+    arrays = []
+    for descriptor in header['arrays']:
+        dtype = np.dtype(descriptor['dtype'])
+        count = int(np.prod(descriptor['shape'], dtype=np.int64))
+        array = np.frombuffer(body, dtype=dtype, count=count, offset=data_start + descriptor['offset'])
+        arrays.append(array.reshape(descriptor['shape']))
+
+    return _unpack(header['data'], arrays)
@@ -0,0 +1,111 @@
+"""
+Earthdata authentication for the app.
+
+Logging in to NASA Earthdata is a network call, so it is deferred until the
+first NASA request instead of running when the views are imported.
+"""
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timezone
+
+import earthaccess
+
+logger = logging.getLogger(__name__)
+
+# Log in again after this many seconds, even if the token is still valid
+EARTHDATA_SESSION_MAX_AGE = int(os.environ.get('EARTHDATA_SESSION_MAX_AGE', 12 * 3600))
+
+
+def token_expiration(auth):
+    """Expiration time of the Earthdata token of an Auth, if it is known"""
+    token = getattr(auth, 'token', None) or {}
+    expiration_date = token.get('expiration_date')
+    if not expiration_date:
+        return None
+    try:
+        return datetime.strptime(expiration_date, "%m/%d/%Y").replace(tzinfo=timezone.utc)
+    except ValueError:
+        return None
+
+
+def is_auth_error(error):
+    """Whether an exception, or one it was raised from, is an HTTP 401 or 403 response"""
+    while error is not None:
+        status = getattr(error, 'status', None)
+        if status is None:
+            status = getattr(getattr(error, 'response', None), 'status_code', None)
+        if status in (401, 403):
+            return True
+        error = error.__cause__ or error.__context__
+    return False
+
+
+class EarthdataSession:
+    """
+    Earthdata login shared by the process.
+
+    The login happens on the first call to ensure() and is repeated once the
+    session is older than max_age or its token has expired. Safe to use from
+    several threads.
+    """
+
+    def __init__(self, max_age=EARTHDATA_SESSION_MAX_AGE):
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        self._auth = None
+        self._logged_in_at = None
+
+    @property
+    def authenticated(self):
+        """Whether the process is logged in, without triggering a login"""
+        return self._auth is not None and self._auth.authenticated and not self._expired()
+
+    def _expired(self):
+        if self._logged_in_at is None:
+            return True
+        if time.monotonic() - self._logged_in_at > self.max_age:
+            return True
+        expiration = token_expiration(self._auth)
+        return expiration is not None and datetime.now(timezone.utc) >= expiration
+
+    def ensure(self):
+        """
+        Log in if needed and return the earthaccess Auth.
+
+        Raises RuntimeError if authentication fails.
+        """
+        if self.authenticated:
+            return self._auth
+        with self._lock:
+            if not self.authenticated:
+                self._login()
+            return self._auth
+
+    def invalidate(self, since=None):
+        """
+        Force a new login on the next call to ensure().
+
+        With since, a time.monotonic() value, nothing is done if the session
+        logged in again after it, so requests failing at once log in once.
+        """
+        with self._lock:
+            if since is None or self._logged_in_at is None or self._logged_in_at <= since:
+                self._logged_in_at = None
+
+    def _login(self):
+        if self._auth is not None:
+            # earthaccess skips the login while it considers itself authenticated
+            self._auth.authenticated = False
+
+        auth = earthaccess.login()
+        if not auth.authenticated:
+            auth = earthaccess.login(strategy='netrc')
+
+        if not auth.authenticated:
+            raise RuntimeError("Authentication failed. Please check your Earthdata credentials.")
+
+        self._auth = auth
+        self._logged_in_at = time.monotonic()
+        logger.info("Authenticated with NASA Earthdata")
@@ -0,0 +1,173 @@
+"""
+Redis-backed job queue and result store.
+
+Long NASA requests can be submitted as jobs instead of being computed on the
+request path. A job is a Redis hash holding its status and progress, its
+result is stored next to it with the cache codec, and its id is pushed to a
+queue that the run_jobs management command consumes.
+
+A popped job is moved to a processing list and leased to its worker for a
+visibility timeout, which the worker renews while the job runs. If the
+worker dies, the lease runs out and requeue_expired puts the job back on the
+queue, up to max_attempts times, after which the job fails.
+"""
+import json
+import time
+import uuid
+
+from . import codec
+
+JOB_QUEUE_KEY = "jobs:queue"
+
+STATUS_QUEUED = "queued"
+STATUS_RUNNING = "running"
+STATUS_DONE = "done"
+STATUS_FAILED = "failed"
+FINISHED_STATUSES = (STATUS_DONE, STATUS_FAILED)
+
+
+class JobStore:
+    """
+    Jobs stored in Redis.
+
+    Jobs and their results expire expiry seconds after their last update.
+    Redis errors are not caught: jobs are useless without Redis, so callers
+    decide how to report them.
+
+    pop blocks on blocking_client, which defaults to client. Blocking pops
+    must not run on a client whose socket timeout is shorter than the pop
+    timeout, or the read times out before Redis answers.
+    """
+
+    def __init__(self, client, expiry=24 * 3600, queue_key=JOB_QUEUE_KEY,
+                 blocking_client=None, visibility_timeout=300, max_attempts=3):
+        self.client = client
+        self.blocking_client = blocking_client or client
+        self.expiry = expiry
+        self.queue_key = queue_key
+        self.processing_key = f"{queue_key}:processing"
+        self.leases_key = f"{queue_key}:leases"
+        self.visibility_timeout = visibility_timeout
+        self.max_attempts = max_attempts
+
+    def _key(self, job_id):
+        return f"job:{job_id}"
+
+    def _result_key(self, job_id):
+        return f"job:{job_id}:result"
+
+    def create(self, kind, params, enqueue=True):
+        """Store a new job and queue it for the workers, returning its id"""
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        pipe = self.client.pipeline()
+        pipe.hset(self._key(job_id), mapping={
+            'kind': kind,
+            'params': json.dumps(params),
+            'status': STATUS_QUEUED,
+            'progress': '',
+            'error': '',
+            'created_at': now,
+            'updated_at': now,
+        })
+        pipe.expire(self._key(job_id), self.expiry)
+        if enqueue:
+            pipe.rpush(self.queue_key, job_id)
+        pipe.execute()
+        return job_id
+
+    def get(self, job_id):
+        """Status of a job as a dict, without its result, or None if it is unknown"""
+        fields = self.client.hgetall(self._key(job_id))
+        if not fields:
+            return None
+        job = {key.decode(): value.decode() for key, value in fields.items()}
+        job['params'] = json.loads(job['params'])
+        job['created_at'] = float(job['created_at'])
+        job['updated_at'] = float(job['updated_at'])
+        return job
+
+    def get_result(self, job_id):
+        """Result of a finished job, or None"""
+        payload = self.client.get(self._result_key(job_id))
+        if payload is None:
+            return None
+        return codec.decode(payload)
+
+    def update(self, job_id, **fields):
+        """Update fields of a job, e.g. its status or progress"""
+        fields['updated_at'] = time.time()
+        pipe = self.client.pipeline()
+        pipe.hset(self._key(job_id), mapping=fields)
+        pipe.expire(self._key(job_id), self.expiry)
+        pipe.execute()
+
+    def complete(self, job_id, result):
+        """Store the result of a job and mark it done"""
+        self.client.set(self._result_key(job_id), codec.encode(result), ex=self.expiry)
+        self.update(job_id, status=STATUS_DONE, progress='')
+
+    def fail(self, job_id, error):
+        """Mark a job as failed with an error message"""
+        self.update(job_id, status=STATUS_FAILED, progress='', error=error)
+
+    def pop(self, timeout=5):
+        """
+        Block up to timeout seconds for the next queued job id, or None.
+
+        The job is leased to the caller, which must renew the lease with
+        touch while it runs and release it once the job is finished.
+        """
+        job_id = self.blocking_client.blmove(
+            self.queue_key, self.processing_key, timeout, "LEFT", "RIGHT"
+        )
+        if job_id is None:
+            return None
+        job_id = job_id.decode()
+        self.client.zadd(self.leases_key, {job_id: time.time() + self.visibility_timeout})
+        return job_id
+
+    def touch(self, job_id):
+        """Renew the lease of a popped job for another visibility timeout"""
+        self.client.zadd(self.leases_key, {job_id: time.time() + self.visibility_timeout}, xx=True)
+
+    def release(self, job_id):
+        """Drop the lease of a popped job, once it is finished"""
+        pipe = self.client.pipeline()
+        pipe.zrem(self.leases_key, job_id)
+        pipe.lrem(self.processing_key, 1, job_id)
+        pipe.execute()
+
+    def requeue_expired(self):
+        """
+        Put the popped jobs whose lease ran out back on the queue.
+
+        Returns the ids of the requeued jobs. A job that was already
+        attempted max_attempts times is failed instead.
+        """
+        now = time.time()
+        # A job popped just now may not have its lease yet; give it one, so
+        # it is only requeued if its worker never renews it
+        for job_id in self.client.lrange(self.processing_key, 0, -1):
+            self.client.zadd(self.leases_key, {job_id: now + self.visibility_timeout}, nx=True)
+
+        requeued = []
+        for job_id in self.client.zrangebyscore(self.leases_key, "-inf", now):
+            # Only one of the workers sweeping at the same time takes the job
+            if not self.client.zrem(self.leases_key, job_id):
+                continue
+            job_id = job_id.decode()
+            # Not processing anymore if it was released since the lease was read
+            if not self.client.lrem(self.processing_key, 1, job_id):
+                continue
+            status = self.client.hget(self._key(job_id), 'status')
+            if status is None or status.decode() in FINISHED_STATUSES:
+                continue
+            attempts = self.client.hincrby(self._key(job_id), 'attempts', 1)
+            if attempts >= self.max_attempts:
+                self.fail(job_id, f"The job was interrupted {attempts} times")
+                continue
+            self.update(job_id, status=STATUS_QUEUED, progress='')
+            self.client.rpush(self.queue_key, job_id)
+            requeued.append(job_id)
+        return requeued
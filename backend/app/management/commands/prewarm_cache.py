@@ -0,0 +1,140 @@
+"""
+Management command to pre-warm the current map cache.
+
+The window served by get_current_map rolls over at UTC midnight, and the
+first request for a location after that pays the full NASA fetch. This
+command fetches and caches the new window for the hot locations ahead of
+the users.
+"""
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timezone, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+
+from app.models import Measurement, Region, Site
+from app import views
+
+
+def parse_location(value):
+    """Parse a 'lat,lon' string into a (lat, lon) tuple"""
+    try:
+        lat, lon = (float(part) for part in value.split(','))
+    except ValueError:
+        raise CommandError(f"Invalid location '{value}', expected 'lat,lon'")
+    if not (-90 <= lat <= 90) or not (-180 <= lon <= 180):
+        raise CommandError(f"Location '{value}' is out of range")
+    return lat, lon
+
+
+class Command(BaseCommand):
+    help = "Pre-fetch and cache the current map window for hot locations."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--location",
+            action="append",
+            default=[],
+            help="Extra 'lat,lon' location to pre-warm. Can be repeated.",
+        )
+        parser.add_argument(
+            "--no-db",
+            action="store_true",
+            help="Skip the Site and Measurement regions stored in the database.",
+        )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=int(os.environ.get("PREWARM_WORKERS", 4)),
+            help="Number of locations fetched concurrently.",
+        )
+        parser.add_argument(
+            "--watch",
+            action="store_true",
+            help="Keep running and pre-warm every time the window rolls over.",
+        )
+        parser.add_argument(
+            "--delay",
+            type=int,
+            default=60,
+            help="Seconds to wait after UTC midnight before pre-warming in --watch mode.",
+        )
+
+    def get_locations(self, options):
+        """Collect the distinct locations to pre-warm"""
+        locations = [parse_location(value) for value in options["location"]]
+
+        # Locations from the environment, separated by ';'
+        for value in os.environ.get("PREWARM_LOCATIONS", "").split(";"):
+            if value.strip():
+                locations.append(parse_location(value.strip()))
+
+        if not options["no_db"]:
+            region_ids = set(Site.objects.values_list("region_id", flat=True))
+            region_ids.update(Measurement.objects.values_list("region_id", flat=True))
+            locations.extend(Region.objects.filter(id__in=region_ids).values_list("lat", "lon"))
+
+        # Keep the order, drop duplicates
+        return list(dict.fromkeys((float(lat), float(lon)) for lat, lon in locations))
+
+    def prewarm_location(self, lat, lon, start_date, end_date):
+        """Fetch and cache one location, returning a short status"""
+        cache_key = views.current_map_cache_key(lat, lon, start_date, end_date)
+        cached_data, stale = views.get_cache_entry(cache_key)
+        if cached_data and not stale:
+            return "cached"
+
+        lat_bounds, lon_bounds = views.lat_lon_to_bounds(lat, lon, radius_km=10)
+        response_data = views.build_current_map_response(
+            cache_key, lat, lon, lat_bounds, lon_bounds, start_date, end_date
+        )
+        return "fetched" if response_data is not None else "no data"
+
+    def prewarm(self, locations, workers):
+        start_date, end_date = views.current_map_window()
+        self.stdout.write(
+            f"Pre-warming {len(locations)} locations for {start_date:%Y-%m-%d} "
+            f"with {workers} workers..."
+        )
+
+        failures = 0
+        started = time.monotonic()
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = {
+                executor.submit(self.prewarm_location, lat, lon, start_date, end_date): (lat, lon)
+                for lat, lon in locations
+            }
+            for done, future in enumerate(as_completed(futures), start=1):
+                lat, lon = futures[future]
+                try:
+                    status = future.result()
+                    self.stdout.write(f"[{done}/{len(locations)}] {lat},{lon}: {status}")
+                except Exception as e:
+                    failures += 1
+                    self.stderr.write(f"[{done}/{len(locations)}] {lat},{lon}: failed ({e})")
+
+        elapsed = time.monotonic() - started
+        message = f"Pre-warmed {len(locations) - failures}/{len(locations)} locations in {elapsed:.1f}s"
+        if failures:
+            self.stdout.write(self.style.WARNING(message))
+        else:
+            self.stdout.write(self.style.SUCCESS(message))
+
+    def handle(self, *args, **options):
+        if options["workers"] < 1:
+            raise CommandError("--workers must be at least 1")
+
+        if not options["watch"]:
+            self.prewarm(self.get_locations(options), options["workers"])
+            return
+
+        while True:
+            # Locations are read again each day to pick up new sites
+            self.prewarm(self.get_locations(options), options["workers"])
+
+            now = datetime.now(timezone.utc)
+            next_rollover = now.replace(hour=0, minute=0, second=0, microsecond=0) + timedelta(days=1)
+            wait = (next_rollover - now).total_seconds() + options["delay"]
+            self.stdout.write(f"Next pre-warm at {next_rollover + timedelta(seconds=options['delay'])}")
+            time.sleep(wait)
@@ -0,0 +1,102 @@
+"""
+Management command to run the queued NASA jobs.
+
+Jobs are submitted through the job API and queued in Redis. This command
+pops them from the queue and runs the fetch and aggregation pipeline outside
+of the web workers, so long date ranges are not bound by request timeouts.
+
+While jobs run, a heartbeat renews their leases and requeues the jobs of
+workers that stopped without finishing them.
+"""
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import redis
+from django.core.management.base import BaseCommand, CommandError
+
+from app import views
+
+
+class Command(BaseCommand):
+    help = "Run queued NASA jobs."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=int(os.environ.get("JOB_WORKERS", 2)),
+            help="Number of jobs run concurrently.",
+        )
+        parser.add_argument(
+            "--poll",
+            type=int,
+            default=5,
+            help="Seconds to block waiting for a job before checking again.",
+        )
+
+    def run(self, job_id, slots):
+        try:
+            started = time.monotonic()
+            views.run_job(job_id)
+            views.job_store.release(job_id)
+            self.stdout.write(f"Job {job_id} finished in {time.monotonic() - started:.1f}s")
+        except Exception as e:
+            # The lease is kept, so the job is requeued once it runs out
+            self.stderr.write(f"Job {job_id} failed ({e})")
+        finally:
+            with self.running_lock:
+                self.running.discard(job_id)
+            slots.release()
+
+    def heartbeat(self, interval):
+        """Renew the leases of the running jobs and requeue the expired ones of any worker"""
+        while True:
+            time.sleep(interval)
+            try:
+                with self.running_lock:
+                    running = list(self.running)
+                for job_id in running:
+                    views.job_store.touch(job_id)
+                for job_id in views.job_store.requeue_expired():
+                    self.stdout.write(f"Job {job_id} requeued after its worker stopped")
+            except redis.exceptions.RedisError as e:
+                self.stderr.write(f"Job heartbeat failed ({e})")
+
+    def handle(self, *args, **options):
+        workers = options["workers"]
+        if workers < 1:
+            raise CommandError("--workers must be at least 1")
+
+        # Only pop a job when a worker is free, so queued jobs stay
+        # available to the other run_jobs processes
+        slots = threading.Semaphore(workers)
+        self.running = set()
+        self.running_lock = threading.Lock()
+        threading.Thread(
+            target=self.heartbeat, args=(views.job_store.visibility_timeout / 3,),
+            name="job-heartbeat", daemon=True,
+        ).start()
+        backoff = 1
+        self.stdout.write(f"Waiting for jobs with {workers} workers...")
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="job") as executor:
+            while True:
+                slots.acquire()
+                try:
+                    job_id = views.job_store.pop(timeout=options["poll"])
+                except redis.exceptions.RedisError as e:
+                    slots.release()
+                    self.stderr.write(f"Job queue unavailable ({e}), retrying in {backoff}s")
+                    time.sleep(backoff)
+                    backoff = min(backoff * 2, 60)
+                    continue
+                backoff = 1
+
+                if job_id is None:
+                    slots.release()
+                    continue
+                self.stdout.write(f"Job {job_id} started")
+                with self.running_lock:
+                    self.running.add(job_id)
+                executor.submit(self.run, job_id, slots)
@@ -0,0 +1,149 @@
+"""
+Rendering of reduced TEMPO grids to PNG map tiles.
+
+Tiles follow the web mercator z/x/y scheme used by Leaflet. Each pixel takes
+the value of the nearest grid cell, which is colored with the viridis
+gradient of the frontend map. Pixels without data are transparent. PNGs are
+encoded with zlib, without an imaging library.
+"""
+import math
+import struct
+import zlib
+
+import numpy as np
+
+TILE_PIXELS = 256
+# Opacity of pixels with data, so the base map stays visible
+TILE_ALPHA = 200
+
+# Same gradient as the heat layers of the frontend map component
+VIRIDIS_STOPS = [
+    (0.0, '#440154'),
+    (0.1, '#482173'),
+    (0.2, '#433E85'),
+    (0.3, '#38598C'),
+    (0.4, '#2D708E'),
+    (0.5, '#25858E'),
+    (0.6, '#1E9B8A'),
+    (0.7, '#2BB07F'),
+    (0.8, '#51C56A'),
+    (0.9, '#85D54A'),
+    (1.0, '#FDE725'),
+]
+
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+
+
+def colormap_lut(stops, size=256):
+    """RGB lookup table of size colors interpolated between (position, hex color) stops"""
+    positions = [position for position, _ in stops]
+    colors = np.array([
+        [int(color[i:i + 2], 16) for i in (1, 3, 5)] for _, color in stops
+    ], dtype=float)
+    samples = np.linspace(0, 1, size)
+    lut = np.column_stack([np.interp(samples, positions, colors[:, channel]) for channel in range(3)])
+    return np.round(lut).astype(np.uint8)
+
+
+VIRIDIS_LUT = colormap_lut(VIRIDIS_STOPS)
+
+
+def tile_latitude(z, y):
+    """Latitude of the top edge of tile row y, which may be fractional"""
+    n = math.pi - 2 * math.pi * y / 2 ** z
+    return math.degrees(math.atan(math.sinh(n)))
+
+
+def tile_bounds(z, x, y):
+    """(lat_bounds, lon_bounds) of a tile"""
+    lon_min = x / 2 ** z * 360 - 180
+    lon_max = (x + 1) / 2 ** z * 360 - 180
+    return (tile_latitude(z, y + 1), tile_latitude(z, y)), (lon_min, lon_max)
+
+
+def pixel_centers(z, x, y, size=TILE_PIXELS):
+    """Latitudes of the pixel rows (top to bottom) and longitudes of the pixel columns of a tile"""
+    offsets = (np.arange(size) + 0.5) / size
+    lons = (x + offsets) / 2 ** z * 360 - 180
+    lats = np.degrees(np.arctan(np.sinh(np.pi - 2 * np.pi * (y + offsets) / 2 ** z)))
+    return lats, lons
+
+
+def nearest_indices(coords, values):
+    """
+    Index of the nearest coordinate of each value, and whether it is within half a cell.
+
+    coords must be sorted ascending.
+    """
+    if len(coords) == 0:
+        return np.zeros(len(values), dtype=int), np.zeros(len(values), dtype=bool)
+    upper = np.clip(np.searchsorted(coords, values), 1, max(len(coords) - 1, 1))
+    lower = upper - 1
+    if len(coords) == 1:
+        indices = np.zeros(len(values), dtype=int)
+    else:
+        indices = np.where(np.abs(values - coords[lower]) <= np.abs(coords[upper] - values), lower, upper)
+    half_step = np.median(np.diff(coords)) / 2 if len(coords) > 1 else 0
+    return indices, np.abs(coords[indices] - values) <= half_step
+
+
+def sample_grid(data_array, lats, lons):
+    """Values of a latitude x longitude grid at the nearest cell of each (lat, lon) pixel, NaN outside it"""
+    data_array = data_array.transpose('latitude', 'longitude').sortby(['latitude', 'longitude'])
+    lat_coords = np.asarray(data_array.coords['latitude'].values, dtype=float)
+    lon_coords = np.asarray(data_array.coords['longitude'].values, dtype=float)
+
+    lat_indices, lat_valid = nearest_indices(lat_coords, lats)
+    lon_indices, lon_valid = nearest_indices(lon_coords, lons)
+    values = np.asarray(data_array.values, dtype=float)
+    if values.size == 0:
+        return np.full((len(lats), len(lons)), np.nan)
+
+    sampled = values[np.ix_(lat_indices, lon_indices)]
+    sampled[~np.outer(lat_valid, lon_valid)] = np.nan
+    return sampled
+
+
+def colorize(values, vmin, vmax, lut=VIRIDIS_LUT, alpha=TILE_ALPHA):
+    """RGBA image of values scaled from vmin to vmax, transparent where they are NaN"""
+    valid = np.isfinite(values)
+    scaled = np.clip((np.where(valid, values, vmin) - vmin) / (vmax - vmin), 0, 1)
+    rgba = np.zeros(values.shape + (4,), dtype=np.uint8)
+    rgba[..., :3] = lut[np.round(scaled * (len(lut) - 1)).astype(int)]
+    rgba[..., 3] = np.where(valid, alpha, 0)
+    rgba[~valid, :3] = 0
+    return rgba
+
+
+def _png_chunk(kind, data):
+    return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data))
+
+
+def encode_png(rgba, level=6):
+    """PNG bytes of an 8 bit RGBA image"""
+    height, width, _ = rgba.shape
+    # Each scanline starts with its filter type, 0 (none)
+    scanlines = np.zeros((height, width * 4 + 1), dtype=np.uint8)
+    scanlines[:, 1:] = rgba.reshape(height, width * 4)
+    header = struct.pack('>IIBBBBB', width, height, 8, 6, 0, 0, 0)
+    return (
+        PNG_SIGNATURE
+        + _png_chunk(b'IHDR', header)
+        + _png_chunk(b'IDAT', zlib.compress(scanlines.tobytes(), level))
+        + _png_chunk(b'IEND', b'')
+    )
+
+
+def render_tile(data_array, z, x, y, vmin, vmax, size=TILE_PIXELS):
+    """
+    PNG of a tile of a grid.
+
+    data_array is a latitude x longitude grid covering the tile, or None
+    for an empty tile.
+    """
+    if data_array is None:
+        values = np.full((size, size), np.nan)
+    else:
+        lats, lons = pixel_centers(z, x, y, size)
+        values = sample_grid(data_array, lats, lons)
+    return encode_png(colorize(values, vmin, vmax))
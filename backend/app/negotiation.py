@@ -0,0 +1,146 @@
+"""
+Content negotiation for the NASA map responses.
+
+Map responses are float-heavy, so besides JSON they can be served as
+MessagePack or as an Arrow IPC stream, chosen from the Accept header.
+MessagePack keeps the JSON structure with binary grid values. Arrow holds
+the map cells as columns, with the rest of the response as JSON in the
+schema metadata. A format is only offered when its package is installed.
+"""
+import json
+
+import numpy as np
+from django.http import HttpResponse, JsonResponse
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import pyarrow
+    import pyarrow.ipc
+except ImportError:
+    pyarrow = None
+
+MEDIA_JSON = 'application/json'
+MEDIA_MSGPACK = 'application/msgpack'
+MEDIA_ARROW = 'application/vnd.apache.arrow.stream'
+
+# Schema metadata key of the non-cell part of an Arrow response
+ARROW_RESPONSE_METADATA = b'response'
+
+
+def available_media_types():
+    """Media types that can be rendered, preferred first"""
+    media_types = [MEDIA_JSON]
+    if msgpack is not None:
+        media_types.append(MEDIA_MSGPACK)
+    if pyarrow is not None:
+        media_types.append(MEDIA_ARROW)
+    return media_types
+
+
+def parse_accept(accept):
+    """List of (media type, quality) of an Accept header, in header order"""
+    accepted = []
+    for item in accept.split(','):
+        media_type, *params = [part.strip() for part in item.split(';')]
+        if not media_type:
+            continue
+        quality = 1.0
+        for param in params:
+            name, _, value = param.partition('=')
+            if name.strip() == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        accepted.append((media_type.lower(), quality))
+    return accepted
+
+
+def select_media_type(accept):
+    """
+    Best media type to render for an Accept header.
+
+    Exact media types win over wildcards at equal quality. Falls back to
+    JSON when nothing acceptable can be rendered, as Django views do.
+    """
+    if not accept:
+        return MEDIA_JSON
+    available = available_media_types()
+    best, best_rank = MEDIA_JSON, None
+    for media_type, quality in parse_accept(accept):
+        if quality <= 0:
+            continue
+        if media_type in available:
+            candidate, specificity = media_type, 2
+        elif media_type in ('*/*', 'application/*'):
+            candidate, specificity = MEDIA_JSON, 1
+        else:
+            continue
+        rank = (quality, specificity)
+        if best_rank is None or rank > best_rank:
+            best, best_rank = candidate, rank
+    return best
+
+
+def _msgpack_default(value):
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError(f"Cannot serialize {type(value).__name__}")
+
+
+def arrow_table(response_data):
+    """
+    Arrow table of the map cells of a response.
+
+    map_data must hold, per product, the longitude, latitude and value
+    arrays of its cells. Everything else goes to the schema metadata.
+    Coordinates stay float64, as in the JSON and MessagePack responses, and
+    values are float32 like the cached grids.
+    """
+    products, longitudes, latitudes, values = [], [], [], []
+    for product_name, cells in response_data['map_data'].items():
+        products.append(np.full(len(cells['value']), product_name, dtype=object))
+        longitudes.append(cells['longitude'])
+        latitudes.append(cells['latitude'])
+        values.append(cells['value'])
+
+    def column(arrays, dtype):
+        return np.concatenate(arrays).astype(dtype) if arrays else np.empty(0, dtype=dtype)
+
+    metadata = {key: value for key, value in response_data.items() if key != 'map_data'}
+    return pyarrow.table(
+        {
+            'product': pyarrow.array(column(products, object), type=pyarrow.string()).dictionary_encode(),
+            'longitude': column(longitudes, np.float64),
+            'latitude': column(latitudes, np.float64),
+            'value': column(values, np.float32),
+        },
+        metadata={ARROW_RESPONSE_METADATA: json.dumps(metadata)},
+    )
+
+
+def render(response_data, media_type, status=200):
+    """Response with response_data rendered as media_type"""
+    if media_type == MEDIA_MSGPACK:
+        response = HttpResponse(
+            msgpack.packb(response_data, use_bin_type=True, default=_msgpack_default),
+            content_type=MEDIA_MSGPACK, status=status,
+        )
+    elif media_type == MEDIA_ARROW:
+        table = arrow_table(response_data)
+        sink = pyarrow.BufferOutputStream()
+        with pyarrow.ipc.new_stream(sink, table.schema) as writer:
+            writer.write_table(table)
+        response = HttpResponse(
+            sink.getvalue().to_pybytes(), content_type=MEDIA_ARROW, status=status
+        )
+    else:
+        response = JsonResponse(response_data, status=status)
+    response['Vary'] = 'Accept'
+    return response
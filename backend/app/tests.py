@@ -0,0 +1,811 @@
+"""
+Tests of the app.
+"""
+import asyncio
+import json
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from datetime import datetime, timezone
+from unittest import mock
+
+import msgpack
+import numpy as np
+import pyarrow
+import pyarrow.ipc
+import redis
+import xarray as xr
+from django.test import RequestFactory, SimpleTestCase
+
+from . import cache, codec, earthdata, jobs, negotiation, views
+from .chunkcache import BlockStore
+
+GRANULE_URL = "https://example.com/granule.nc"
+GRANULE_BYTES = bytes(range(256)) * 16
+
+
+class CachedReferenceReadTests(SimpleTestCase):
+    """Reads of kerchunk references through the chunk cache."""
+
+    def setUp(self):
+        self.requests = []
+
+        async def fetch(fs, url, start=None, end=None, **kwargs):
+            self.requests.append((url, start, end))
+            return GRANULE_BYTES[start:end]
+
+        patcher = mock.patch("fsspec.implementations.http.HTTPFileSystem._cat_file", fetch)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.store = BlockStore(self.directory.name, 1024 * 1024, block_size=256)
+
+    def read(self, start, length):
+        # A byte array over the referenced range, opened like a TEMPO group
+        references = {"version": 1, "refs": {
+            ".zgroup": json.dumps({"zarr_format": 2}),
+            "chunk/.zarray": json.dumps({
+                "chunks": [length], "compressor": None, "dtype": "|u1", "fill_value": None,
+                "filters": None, "order": "C", "shape": [length], "zarr_format": 2,
+            }),
+            "chunk/.zattrs": json.dumps({"_ARRAY_DIMENSIONS": ["byte"]}),
+            "chunk/0": [GRANULE_URL, start, length],
+        }}
+        session = mock.Mock(storage_options={})
+        with mock.patch.object(views, "chunk_store", self.store), \
+                mock.patch.object(views.earthaccess, "get_fsspec_https_session", return_value=session):
+            ds = xr.open_dataset(references, engine="kerchunk", storage_options=views.tempo_storage_options())
+            return ds["chunk"].values.tobytes()
+
+    def test_https_reference_is_read(self):
+        self.assertEqual(self.read(100, 600), GRANULE_BYTES[100:700])
+        self.assertEqual(self.requests, [(GRANULE_URL, 0, 768)])
+
+    def test_cached_blocks_are_not_requested_again(self):
+        self.read(100, 600)
+        self.requests.clear()
+        self.assertEqual(self.read(300, 100), GRANULE_BYTES[300:400])
+        self.assertEqual(self.requests, [])
+
+    def test_eviction_runs_off_the_read_path(self):
+        store = BlockStore(self.directory.name, 512, block_size=256, sweep_fraction=1)
+        with mock.patch.object(BlockStore, "evict") as evict:
+            store.put(GRANULE_URL, 0, GRANULE_BYTES[:256])
+            store._eviction_thread.join()
+        evict.assert_called_once_with()
+
+
+class FailedFetchCachingTests(SimpleTestCase):
+    """Tiles of a window where a product failed are not cached."""
+
+    def setUp(self):
+        patcher = mock.patch.object(views, "save_to_cache")
+        self.save_to_cache = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def fetch_failing(self, regions, start_date, end_date, count=10):
+        return [{} for _ in regions], ["NO2"]
+
+    def test_tiles_are_not_cached(self):
+        with mock.patch.object(views, "fetch_tempo_regions", self.fetch_failing):
+            with self.assertRaises(views.TempoFetchError):
+                views.fetch_tiles([(0, 0), (0, 1)], "2024-08-01 00:00", "2024-08-01 23:59")
+        self.save_to_cache.assert_not_called()
+
+    def test_aggregate_tiles_are_not_stored(self):
+        with mock.patch.object(views, "fetch_tempo_regions", self.fetch_failing):
+            with self.assertRaises(views.TempoFetchError):
+                views.fetch_aggregate_tiles([(0, 0)], datetime(2024, 8, 1, tzinfo=timezone.utc))
+        self.save_to_cache.assert_not_called()
+
+    def test_map_tile_is_not_persisted(self):
+        store = mock.Mock(get=mock.Mock(return_value=None))
+        with mock.patch.object(views, "fetch_tempo_regions", self.fetch_failing), \
+                mock.patch.object(views, "map_tile_store", store), \
+                mock.patch.object(views, "get_cache_entry", return_value=(None, False)):
+            response = views.map_tile_response({}, "NO2", "2024-08-01", 9, 89, 206)
+        self.assertEqual(response.status_code, 503)
+        store.put.assert_not_called()
+        self.save_to_cache.assert_not_called()
+
+    def test_range_is_unavailable(self):
+        request = RequestFactory().get(
+            "/", {"lat": 34, "lon": -118, "start_date": "2024-08-01", "end_date": "2024-08-01T12:00:00"}
+        )
+        with mock.patch.object(views, "fetch_tempo_regions", self.fetch_failing):
+            response = views.data_range_response(request)
+        self.assertEqual(response.status_code, 503)
+        self.assertNotIn("Cache-Control", response)
+        self.save_to_cache.assert_not_called()
+
+
+class MemoryCache:
+    """In-memory stand-in for the Redis cache backend"""
+
+    def __init__(self):
+        self.entries = {}
+
+    def get(self, key, local=True):
+        return self.entries.get(key)
+
+    def set(self, key, value, expiry=None):
+        self.entries[key] = value
+
+
+class CachedResponseRenderingTests(SimpleTestCase):
+    """Fresh map responses are rendered like later cache hits."""
+
+    def setUp(self):
+        patcher = mock.patch.object(views, "cache", MemoryCache())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def reduced(self, lat_bounds, lon_bounds, start_date, end_date, serve_stale=True):
+        latitude = np.linspace(*lat_bounds, 4)
+        longitude = np.linspace(*lon_bounds, 5)
+        # Values that float32 can't represent exactly
+        values = 2921352738601812.0 + np.arange(20, dtype=float).reshape(4, 5)
+        mean_column = xr.DataArray(
+            values, coords={"latitude": latitude, "longitude": longitude}, dims=("latitude", "longitude")
+        )
+        return {"NO2": {"mean_column": mean_column, "data_points": 3}}
+
+    def test_miss_and_hit_have_the_same_body(self):
+        start_date, end_date = views.current_map_window()
+        lat_bounds, lon_bounds = views.lat_lon_to_bounds(34, -118, radius_km=10)
+        cache_key = views.current_map_cache_key(34, -118, start_date, end_date)
+        for map_format in views.MAP_FORMATS:
+            with mock.patch.object(views, "get_tiled_products", self.reduced):
+                fresh = views.build_current_map_response(
+                    cache_key, 34, -118, lat_bounds, lon_bounds, start_date, end_date, map_format=map_format
+                )
+            cached = views.get_cached_response(cache_key, map_format=map_format)
+            self.assertEqual(
+                negotiation.render(fresh, negotiation.MEDIA_JSON).content,
+                negotiation.render(cached, negotiation.MEDIA_JSON).content,
+            )
+
+
+class DayChunksTests(SimpleTestCase):
+    """Splitting of date ranges at UTC day boundaries."""
+
+    def test_date_only_end_adds_no_empty_chunk(self):
+        chunks = views.day_chunks(
+            datetime(2024, 8, 1, tzinfo=timezone.utc), datetime(2024, 8, 3, tzinfo=timezone.utc)
+        )
+        self.assertEqual([full_day for _, _, full_day in chunks], [True, True])
+        self.assertEqual(chunks[-1][1], datetime(2024, 8, 2, 23, 59, tzinfo=timezone.utc))
+
+    def test_partial_days_are_kept(self):
+        chunks = views.day_chunks(
+            datetime(2024, 8, 1, 12, tzinfo=timezone.utc), datetime(2024, 8, 2, 6, tzinfo=timezone.utc)
+        )
+        self.assertEqual([full_day for _, _, full_day in chunks], [False, False])
+
+
+class CreateJobTests(SimpleTestCase):
+    """Validation of the parameters of a queued date range job."""
+
+    def post(self, body):
+        request = RequestFactory().post("/api/jobs/", json.dumps(body), content_type="application/json")
+        with mock.patch.object(views, "job_store") as job_store:
+            response = views.create_job(request)
+        return response, job_store
+
+    def test_non_string_date_is_rejected(self):
+        response, job_store = self.post({"lat": 34, "lon": -118, "start_date": 20240801, "end_date": "2024-08-02"})
+        self.assertEqual(response.status_code, 400)
+        job_store.create.assert_not_called()
+
+    def test_non_object_body_is_rejected(self):
+        for body in ([{"lat": 34}], "2024-08-01", 34):
+            with self.subTest(body=body):
+                response, job_store = self.post(body)
+                self.assertEqual(response.status_code, 400)
+                job_store.create.assert_not_called()
+
+    def test_non_number_coordinate_is_rejected(self):
+        response, job_store = self.post({"lat": [34], "lon": -118, "start_date": "2024-08-01", "end_date": "2024-08-02"})
+        self.assertEqual(response.status_code, 400)
+        job_store.create.assert_not_called()
+
+
+def encoded(value):
+    """A value as Redis stores it"""
+    return value if isinstance(value, bytes) else str(value).encode()
+
+
+class FakeRedis:
+    """In-memory stand-in for the Redis commands used by the job store"""
+
+    def __init__(self):
+        self.hashes = {}
+        self.lists = {}
+        self.sorted_sets = {}
+        self.strings = {}
+
+    def pipeline(self, transaction=True):
+        return FakePipeline(self)
+
+    def expire(self, key, seconds):
+        return True
+
+    def get(self, key):
+        return self.strings.get(key)
+
+    def set(self, key, value, ex=None):
+        self.strings[key] = encoded(value)
+        return True
+
+    def hset(self, key, mapping):
+        self.hashes.setdefault(key, {}).update(
+            {encoded(field): encoded(value) for field, value in mapping.items()}
+        )
+
+    def hget(self, key, field):
+        return self.hashes.get(key, {}).get(encoded(field))
+
+    def hgetall(self, key):
+        return dict(self.hashes.get(key, {}))
+
+    def hincrby(self, key, field, amount):
+        fields = self.hashes.setdefault(key, {})
+        value = int(fields.get(encoded(field), 0)) + amount
+        fields[encoded(field)] = encoded(value)
+        return value
+
+    def rpush(self, key, value):
+        self.lists.setdefault(key, []).append(encoded(value))
+
+    def lrange(self, key, start, end):
+        values = self.lists.get(key, [])
+        return list(values[start:] if end == -1 else values[start:end + 1])
+
+    def lrem(self, key, count, value):
+        values = self.lists.get(key, [])
+        if encoded(value) not in values:
+            return 0
+        values.remove(encoded(value))
+        return 1
+
+    def blmove(self, source, destination, timeout, source_end, destination_end):
+        values = self.lists.get(source)
+        if not values:
+            return None
+        value = values.pop(0)
+        self.lists.setdefault(destination, []).append(value)
+        return value
+
+    def zadd(self, key, mapping, nx=False, xx=False):
+        scores = self.sorted_sets.setdefault(key, {})
+        added = 0
+        for member, score in mapping.items():
+            member = encoded(member)
+            if (nx and member in scores) or (xx and member not in scores):
+                continue
+            added += member not in scores
+            scores[member] = score
+        return added
+
+    def zrem(self, key, member):
+        return int(self.sorted_sets.get(key, {}).pop(encoded(member), None) is not None)
+
+    def zrangebyscore(self, key, minimum, maximum):
+        minimum, maximum = float(minimum), float(maximum)
+        scores = self.sorted_sets.get(key, {})
+        return [member for member, score in sorted(scores.items(), key=lambda item: item[1])
+                if minimum <= score <= maximum]
+
+
+class FakePipeline:
+    """Commands queued on a FakeRedis and run on execute"""
+
+    def __init__(self, client):
+        self.client = client
+        self.commands = []
+
+    def __getattr__(self, name):
+        def queue(*args, **kwargs):
+            self.commands.append((getattr(self.client, name), args, kwargs))
+            return self
+        return queue
+
+    def execute(self):
+        return [command(*args, **kwargs) for command, args, kwargs in self.commands]
+
+
+class JobLeaseTests(SimpleTestCase):
+    """Requeueing of the jobs whose worker stopped renewing their lease."""
+
+    def setUp(self):
+        self.now = 1_000_000.0
+        patcher = mock.patch.object(jobs.time, "time", lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.store = jobs.JobStore(FakeRedis(), visibility_timeout=300, max_attempts=3)
+
+    def test_expired_lease_is_requeued(self):
+        job_id = self.store.create('data_range', {})
+        self.assertEqual(self.store.pop(), job_id)
+        self.now += 301
+        self.assertEqual(self.store.requeue_expired(), [job_id])
+        self.assertEqual(self.store.get(job_id)['status'], jobs.STATUS_QUEUED)
+        self.assertEqual(self.store.pop(), job_id)
+
+    def test_job_interrupted_max_attempts_times_fails(self):
+        job_id = self.store.create('data_range', {})
+        for _ in range(self.store.max_attempts - 1):
+            self.assertEqual(self.store.pop(), job_id)
+            self.now += 301
+            self.assertEqual(self.store.requeue_expired(), [job_id])
+        self.assertEqual(self.store.pop(), job_id)
+        self.now += 301
+        self.assertEqual(self.store.requeue_expired(), [])
+        job = self.store.get(job_id)
+        self.assertEqual(job['status'], jobs.STATUS_FAILED)
+        self.assertEqual(job['error'], "The job was interrupted 3 times")
+        self.assertIsNone(self.store.pop())
+
+    def test_renewed_lease_is_not_requeued(self):
+        job_id = self.store.create('data_range', {})
+        self.assertEqual(self.store.pop(), job_id)
+        self.now += 200
+        self.store.touch(job_id)
+        self.now += 200
+        self.assertEqual(self.store.requeue_expired(), [])
+        self.assertEqual(self.store.get(job_id)['status'], jobs.STATUS_QUEUED)
+        self.assertIsNone(self.store.pop())
+
+
+class MapBatchTests(SimpleTestCase):
+    """Batch map requests."""
+
+    def test_sites_are_not_looked_up_on_the_request_pool(self):
+        threads = []
+
+        def parse_batch_locations(request, body):
+            threads.append(threading.current_thread().name)
+            return [{'latitude': 34.0, 'longitude': -118.0}]
+
+        request = RequestFactory().post(
+            "/api/nasa/map/batch/", json.dumps({"site_ids": [1]}), content_type="application/json"
+        )
+        with mock.patch.object(views, "parse_batch_locations", parse_batch_locations), \
+                mock.patch.object(views, "map_batch_response", return_value=views.JsonResponse({})) as respond:
+            response = asyncio.run(views.get_map_batch(request))
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(threads[0].startswith("nasa-request"))
+        respond.assert_called_once_with([{'latitude': 34.0, 'longitude': -118.0}], views.MAP_FORMAT_TRIPLES, None)
+
+
+class LoadCachedTilesTests(SimpleTestCase):
+    """Stale and missing tiles of the tile caches."""
+
+    def test_stale_tiles_are_refreshed_and_missing_tiles_fetched(self):
+        entries = {'fresh': ({'v': 1}, False), 'stale': ({'v': 2}, True)}
+        fetched = []
+
+        def fetch(tiles):
+            fetched.append(tiles)
+            return {tile: 3 for tile in tiles}
+
+        with mock.patch.object(views, "get_cache_entry", lambda key: entries.get(key, (None, False))), \
+                mock.patch.object(views, "refresh_in_background") as refresh, \
+                mock.patch.object(views, "single_flight", lambda key, ready, compute: compute()):
+            tile_data = views.load_cached_tiles(
+                ['fresh', 'stale', 'missing'], lambda tile: tile, lambda cached: cached['v'], fetch,
+                lambda tiles: ','.join(tiles),
+            )
+        self.assertEqual(tile_data, {'fresh': 1, 'stale': 2, 'missing': 3})
+        self.assertEqual(fetched, [['missing']])
+        refresh.assert_called_once()
+        self.assertEqual(refresh.call_args.args[0], 'stale')
+
+    def test_stale_tiles_are_fetched_without_serve_stale(self):
+        entries = {'fresh': ({'v': 1}, False), 'stale': ({'v': 2}, True)}
+        fetched = []
+
+        def fetch(tiles):
+            fetched.append(tiles)
+            return {tile: 3 for tile in tiles}
+
+        with mock.patch.object(views, "get_cache_entry", lambda key: entries.get(key, (None, False))), \
+                mock.patch.object(views, "refresh_in_background") as refresh, \
+                mock.patch.object(views, "single_flight", lambda key, ready, compute: ready() or compute()):
+            tile_data = views.load_cached_tiles(
+                ['fresh', 'stale'], lambda tile: tile, lambda cached: cached['v'], fetch,
+                lambda tiles: ','.join(tiles), serve_stale=False,
+            )
+        self.assertEqual(tile_data, {'fresh': 1, 'stale': 3})
+        self.assertEqual(fetched, [['stale']])
+        refresh.assert_not_called()
+
+    def test_stale_response_is_refreshed_from_fresh_tiles(self):
+        refresh = mock.Mock()
+        cached = {'response': {}, 'grids': {}, 'pyramids': {}}
+        with mock.patch.object(views, "get_cache_entry", return_value=(cached, True)), \
+                mock.patch.object(views, "refresh_in_background", lambda key, run: run()):
+            views.get_cached_response("key", refresh=refresh)
+        refresh.assert_called_once_with(serve_stale=False)
+
+
+class CodecTests(SimpleTestCase):
+    """Round trips of the binary cache codec."""
+
+    def test_arrays_of_each_dtype_round_trip(self):
+        for dtype in ('<f8', '<f4', '<i8', '<i4', '|u1', '|b1', '>f8'):
+            with self.subTest(dtype=dtype):
+                array = np.arange(12).reshape(3, 4).astype(dtype)
+                decoded = codec.decode(codec.encode({'grid': array, 'points': [array[0], 3]}))
+                self.assertEqual(decoded['grid'].dtype, np.dtype(dtype))
+                np.testing.assert_array_equal(decoded['grid'], array)
+                np.testing.assert_array_equal(decoded['points'][0], array[0])
+                self.assertEqual(decoded['points'][1], 3)
+
+    def test_nan_and_scalars_round_trip(self):
+        data = {'grid': np.array([[np.nan, 1.5]]), 'count': np.int64(7), 'label': 'NO2', 'none': None}
+        decoded = codec.decode(codec.encode(data))
+        np.testing.assert_array_equal(decoded['grid'], data['grid'])
+        self.assertEqual(decoded['count'], 7)
+        self.assertEqual(decoded['label'], 'NO2')
+        self.assertIsNone(decoded['none'])
+
+    def test_bad_header_is_rejected(self):
+        payload = codec.encode({'value': 1})
+        with self.assertRaises(ValueError):
+            codec.decode(b'JSON' + payload[4:])
+        with self.assertRaises(ValueError):
+            codec.decode(payload[:3] + bytes([codec.VERSION + 1]) + payload[4:])
+        with self.assertRaises(ValueError):
+            codec.decode(b'{"value": 1}')
+
+
+class CacheBackendTests(SimpleTestCase):
+    """Local tier and Redis backoff of the cache backend."""
+
+    def setUp(self):
+        self.now = 1000.0
+        patcher = mock.patch.object(cache.time, "monotonic", lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.backend = cache.CacheBackend("localhost", 6379, local_ttl=60, backoff_base=1, backoff_max=4)
+        self.backend.client = mock.Mock()
+
+    def test_local_tier_hit_skips_redis(self):
+        self.backend.client.set.return_value = True
+        self.backend.set("key", b"value", expiry=3600)
+        self.assertEqual(self.backend.get("key"), b"value")
+        self.backend.client.pipeline.assert_not_called()
+
+    def test_local_copy_of_a_redis_entry_expires(self):
+        self.backend.client.set.return_value = True
+        self.backend.set("key", b"value", expiry=3600)
+        self.now += 61
+        self.backend.client.pipeline.return_value.execute.return_value = [b"newer", 3000 * 1000]
+        self.assertEqual(self.backend.get("key"), b"newer")
+
+    def test_least_recently_used_entry_is_evicted(self):
+        local = cache.LocalCache(max_bytes=10)
+        local.set("a", b"aaaa")
+        local.set("b", b"bbbb")
+        local.get("a")
+        local.set("c", b"cccc")
+        self.assertEqual(local.get("a"), b"aaaa")
+        self.assertIsNone(local.get("b"))
+        self.assertEqual(local.get("c"), b"cccc")
+
+    def test_redis_is_skipped_during_backoff(self):
+        self.backend.client.exists.side_effect = redis.exceptions.ConnectionError("down")
+        self.assertFalse(self.backend.exists("key"))
+        self.assertFalse(self.backend.exists("key"))
+        self.assertEqual(self.backend.client.exists.call_count, 1)
+
+        # The backoff doubles with every failed retry, up to backoff_max
+        for backoff in (1, 2, 4, 4):
+            self.now += backoff - 0.5
+            self.assertFalse(self.backend.available)
+            self.now += 0.5
+            self.assertTrue(self.backend.available)
+            self.backend.exists("key")
+        self.assertEqual(self.backend.client.exists.call_count, 5)
+
+        # A success resets the backoff
+        self.now += 4
+        self.backend.client.exists.side_effect = None
+        self.backend.client.exists.return_value = 1
+        self.assertTrue(self.backend.exists("key"))
+        self.backend.client.exists.side_effect = redis.exceptions.ConnectionError("down")
+        self.backend.exists("key")
+        self.now += 1
+        self.assertTrue(self.backend.available)
+
+    def test_writes_during_an_outage_are_kept_locally(self):
+        self.backend.client.set.side_effect = redis.exceptions.ConnectionError("down")
+        self.backend.set("key", b"value", expiry=3600)
+        self.assertEqual(self.backend.get("key"), b"value")
+        self.now += 3000
+        # Still the only copy, so kept past local_ttl
+        self.assertEqual(self.backend.get("key"), b"value")
+
+
+class LevelOfDetailTests(SimpleTestCase):
+    """Coarsening level of map_data for max_points and zoom."""
+
+    def setUp(self):
+        # 100 x 100 cells of 0.02 degrees
+        coords = np.arange(100) * 0.02
+        self.grid = xr.DataArray(
+            np.ones((100, 100)), coords={"latitude": 30 + coords, "longitude": -120 + coords},
+            dims=("latitude", "longitude"),
+        )
+
+    def level(self, max_points=None, zoom=None):
+        return views.lod_level(self.grid, views.parse_lod_params({'max_points': max_points, 'zoom': zoom}))
+
+    def test_no_lod_keeps_the_grid(self):
+        self.assertEqual(views.lod_level(self.grid, views.parse_lod_params({})), 0)
+
+    def test_max_points(self):
+        self.assertEqual(self.level(max_points=10000), 0)
+        self.assertEqual(self.level(max_points=2500), 1)
+        self.assertEqual(self.level(max_points=2499), 2)
+        self.assertEqual(self.level(max_points=1), 7)
+
+    def test_zoom(self):
+        self.assertEqual(self.level(zoom=10), 0)
+        self.assertEqual(self.level(zoom=5), 3)
+        self.assertEqual(self.level(zoom=0), 8)
+
+    def test_coarser_of_max_points_and_zoom_wins(self):
+        self.assertEqual(self.level(max_points=2500, zoom=5), 3)
+        self.assertEqual(self.level(max_points=1, zoom=10), 7)
+
+    def test_level_is_capped_at_the_pyramid_top(self):
+        pyramid = views.build_pyramid(self.grid)
+        self.assertEqual(len(pyramid), 7)
+        level = views.select_level(self.grid, pyramid, {'max_points': None, 'zoom': 0})
+        self.assertEqual(level.size, 1)
+        coarse = views.select_level(self.grid, pyramid, {'max_points': 2500, 'zoom': None})
+        self.assertEqual(coarse.shape, (50, 50))
+
+
+class NegotiationTests(SimpleTestCase):
+    """Response formats chosen from the Accept header."""
+
+    def test_accept_header(self):
+        cases = [
+            (None, negotiation.MEDIA_JSON),
+            ('', negotiation.MEDIA_JSON),
+            ('application/json', negotiation.MEDIA_JSON),
+            ('application/msgpack', negotiation.MEDIA_MSGPACK),
+            ('application/vnd.apache.arrow.stream', negotiation.MEDIA_ARROW),
+            ('*/*', negotiation.MEDIA_JSON),
+            ('application/*, application/msgpack', negotiation.MEDIA_MSGPACK),
+            ('application/msgpack;q=0.5, application/vnd.apache.arrow.stream', negotiation.MEDIA_ARROW),
+            ('application/msgpack;q=0.9, */*;q=0.9', negotiation.MEDIA_MSGPACK),
+            ('application/msgpack;q=0, application/json;q=0.1', negotiation.MEDIA_JSON),
+            ('text/html', negotiation.MEDIA_JSON),
+            ('application/msgpack;q=oops', negotiation.MEDIA_JSON),
+        ]
+        for accept, media_type in cases:
+            with self.subTest(accept=accept):
+                self.assertEqual(negotiation.select_media_type(accept), media_type)
+
+    def test_missing_package_falls_back_to_json(self):
+        with mock.patch.object(negotiation, "msgpack", None), mock.patch.object(negotiation, "pyarrow", None):
+            self.assertEqual(negotiation.select_media_type('application/msgpack'), negotiation.MEDIA_JSON)
+            self.assertEqual(
+                negotiation.select_media_type('application/vnd.apache.arrow.stream'), negotiation.MEDIA_JSON
+            )
+
+    def response_data(self):
+        return {
+            'units': 'molecules/cm^2',
+            'map_data': {'NO2': {
+                'longitude': np.array([-118.243712, -118.243701]),
+                'latitude': np.array([34.052213, 34.052224]),
+                'value': np.array([1.5e15, 2.5e15], dtype=np.float32),
+            }},
+        }
+
+    def test_msgpack_keeps_the_structure(self):
+        response = negotiation.render(self.response_data(), negotiation.MEDIA_MSGPACK)
+        self.assertEqual(response['Content-Type'], negotiation.MEDIA_MSGPACK)
+        self.assertEqual(response['Vary'], 'Accept')
+        data = msgpack.unpackb(response.content)
+        self.assertEqual(data['units'], 'molecules/cm^2')
+        self.assertEqual(data['map_data']['NO2']['longitude'], [-118.243712, -118.243701])
+
+    def test_arrow_keeps_float64_coordinates(self):
+        response = negotiation.render(self.response_data(), negotiation.MEDIA_ARROW)
+        self.assertEqual(response['Content-Type'], negotiation.MEDIA_ARROW)
+        table = pyarrow.ipc.open_stream(response.content).read_all()
+        self.assertEqual(table.column('product').to_pylist(), ['NO2', 'NO2'])
+        self.assertEqual(table.column('longitude').to_pylist(), [-118.243712, -118.243701])
+        self.assertEqual(table.column('latitude').to_pylist(), [34.052213, 34.052224])
+        self.assertEqual(table.column('value').type, pyarrow.float32())
+        metadata = json.loads(table.schema.metadata[negotiation.ARROW_RESPONSE_METADATA])
+        self.assertEqual(metadata, {'units': 'molecules/cm^2'})
+
+
+class PolarBoundsTests(SimpleTestCase):
+    """Tiles of the bounds of polar latitudes."""
+
+    def assert_tiles_on_the_globe(self, tiles):
+        max_row, max_col = int(90 / views.TILE_SIZE), int(180 / views.TILE_SIZE)
+        self.assertLessEqual(len(tiles), 2 * max_row * 2 * max_col)
+        for row, col in tiles:
+            self.assertTrue(-max_row <= row < max_row and -max_col <= col < max_col)
+
+    def test_polar_latitudes_list_a_bounded_number_of_tiles(self):
+        for lat in (90, -90, 89.9999):
+            with self.subTest(lat=lat):
+                tiles = views.tiles_for_bounds(*views.lat_lon_to_bounds(lat, 0, radius_km=10))
+                self.assert_tiles_on_the_globe(tiles)
+                # One row of tiles around the whole globe
+                self.assertEqual(len(tiles), int(360 / views.TILE_SIZE))
+
+    def test_tiles_inside_the_globe_are_unchanged(self):
+        self.assertEqual(views.tiles_for_bounds((34.1, 34.6), (-118.4, -117.9)), [
+            (68, -237), (68, -236), (69, -237), (69, -236),
+        ])
+
+    def load_tiles(self, tiles, start_date, end_date, serve_stale=True):
+        self.loaded.append(tiles)
+        return {tile: {} for tile in tiles}
+
+    def test_current_map_at_the_pole(self):
+        self.loaded = []
+        request = RequestFactory().get("/", {"lat": 90, "lon": 0})
+        with mock.patch.object(views, "load_tiles", self.load_tiles), \
+                mock.patch.object(views, "get_cache_entry", return_value=(None, False)):
+            response = views.current_map_response(request)
+        self.assertEqual(response.status_code, 404)
+        self.assert_tiles_on_the_globe(self.loaded[0])
+
+    def test_date_range_at_the_pole(self):
+        self.loaded = []
+        request = RequestFactory().get(
+            "/", {"lat": -90, "lon": 180, "start_date": "2024-08-01", "end_date": "2024-08-02"}
+        )
+        with mock.patch.object(views, "fetch_aggregate_tiles", lambda tiles, day: self.load_tiles(tiles, day, day)), \
+                mock.patch.object(views, "get_cache_entry", return_value=(None, False)):
+            response = views.data_range_response(request)
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(len(self.loaded), 1)
+        self.assert_tiles_on_the_globe(self.loaded[0])
+
+    def test_batch_with_a_polar_point(self):
+        self.loaded = []
+        locations = [{'latitude': 90.0, 'longitude': 0.0}, {'latitude': 34.0, 'longitude': -118.0}]
+        with mock.patch.object(views, "load_tiles", self.load_tiles), \
+                mock.patch.object(views, "get_cache_entry", return_value=(None, False)):
+            response = views.map_batch_response(locations)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(json.loads(response.content)['results']), 2)
+        self.assert_tiles_on_the_globe(self.loaded[0])
+        self.assertIn((68, -236), self.loaded[0])
+
+
+class StaleLocalCopyTests(SimpleTestCase):
+    """Local copies of entries another worker already refreshed."""
+
+    def setUp(self):
+        self.backend = cache.CacheBackend("localhost", 6379)
+        self.backend.client = mock.Mock()
+        patcher = mock.patch.object(views, "cache", self.backend)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def entry(self, data, fresh_for):
+        return codec.encode({'fresh_until': time.time() + fresh_for, 'data': data})
+
+    def test_stale_local_copy_is_read_again_from_redis(self):
+        self.backend.local.set("key", self.entry("old", -1), 60)
+        self.backend.client.pipeline.return_value.execute.return_value = [self.entry("new", 3600), 90000 * 1000]
+        self.assertEqual(views.get_cache_entry("key"), ("new", False))
+        # The refreshed entry replaced the local copy
+        self.assertEqual(codec.decode(self.backend.local.get("key"))['data'], "new")
+
+    def test_stale_entry_is_served_while_redis_is_down(self):
+        self.backend.local.set("key", self.entry("old", -1), 60)
+        self.backend.client.pipeline.return_value.execute.side_effect = redis.exceptions.ConnectionError("down")
+        self.assertEqual(views.get_cache_entry("key"), ("old", True))
+
+    def test_fresh_local_copy_skips_redis(self):
+        self.backend.local.set("key", self.entry("new", 3600), 60)
+        self.assertEqual(views.get_cache_entry("key"), ("new", False))
+        self.backend.client.pipeline.assert_not_called()
+
+
+class FetchTaskTimeoutTests(SimpleTestCase):
+    """Timeouts of the tasks run on the shared fetch executor."""
+
+    def setUp(self):
+        executor = ThreadPoolExecutor(max_workers=1)
+        self.addCleanup(executor.shutdown)
+        for name, value in (("fetch_executor", executor), ("TEMPO_FETCH_TIMEOUT", 0.3),
+                            ("TEMPO_FETCH_QUEUE_TIMEOUT", 5)):
+            patcher = mock.patch.object(views, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.release = threading.Event()
+        self.addCleanup(self.release.set)
+
+    def occupy_pool(self):
+        views.fetch_executor.submit(self.release.wait)
+
+    def test_time_queued_does_not_count(self):
+        self.occupy_pool()
+        threading.Timer(0.4, self.release.set).start()
+        self.assertEqual(views.run_fetch_tasks([(time.sleep, 0.1), (len, "ab")]), [None, 2])
+
+    def test_running_task_times_out(self):
+        with self.assertRaises(FutureTimeoutError):
+            views.run_fetch_tasks([(time.sleep, 1)])
+
+    def test_abandoned_tasks_take_no_slot(self):
+        self.occupy_pool()
+        task = mock.Mock()
+        with mock.patch.object(views, "TEMPO_FETCH_QUEUE_TIMEOUT", 0.05):
+            with self.assertRaises(FutureTimeoutError):
+                views.run_fetch_tasks([(task,)])
+        self.release.set()
+        views.fetch_executor.submit(lambda: None).result()
+        task.assert_not_called()
+
+    def test_tasks_are_skipped_past_the_deadline(self):
+        task = mock.Mock()
+        with self.assertRaises(FutureTimeoutError):
+            views.run_fetch_tasks([(task,)], deadline=time.monotonic() - 1)
+        task.assert_not_called()
+
+
+class AuthError(Exception):
+    """HTTP error response of an Earthdata request"""
+
+    def __init__(self, status):
+        super().__init__(f"HTTP {status}")
+        self.status = status
+
+
+class EarthdataRetryTests(SimpleTestCase):
+    """New logins after Earthdata rejects the token."""
+
+    def setUp(self):
+        patcher = mock.patch.object(views, "earthdata_session")
+        self.session = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_auth_error_logs_in_again_and_retries(self):
+        error = RuntimeError("Reference not reachable")
+        error.__cause__ = AuthError(401)
+        fetch = mock.Mock(side_effect=[error, ["subset"]])
+        with mock.patch.object(views, "fetch_tempo_product", fetch):
+            result = views.fetch_tempo_product_logged_in("NO2", [], "2024-08-01 00:00", "2024-08-01 23:59", 10)
+        self.assertEqual(result, ["subset"])
+        self.assertEqual(fetch.call_count, 2)
+        self.session.invalidate.assert_called_once()
+        self.session.ensure.assert_called_once_with()
+
+    def test_other_errors_are_not_retried(self):
+        fetch = mock.Mock(side_effect=AuthError(404))
+        with mock.patch.object(views, "fetch_tempo_product", fetch):
+            with self.assertRaises(AuthError):
+                views.fetch_tempo_product_logged_in("NO2", [], "2024-08-01 00:00", "2024-08-01 23:59", 10)
+        self.assertEqual(fetch.call_count, 1)
+        self.session.invalidate.assert_not_called()
+
+
+class EarthdataSessionTests(SimpleTestCase):
+    """Invalidation of the Earthdata session."""
+
+    def test_invalidate_skips_sessions_renewed_since_the_failure(self):
+        session = earthdata.EarthdataSession()
+        session._logged_in_at = 100.0
+        session.invalidate(since=50.0)
+        self.assertEqual(session._logged_in_at, 100.0)
+        session.invalidate(since=150.0)
+        self.assertIsNone(session._logged_in_at)
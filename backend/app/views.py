@@ -4,27 +4,45 @@ Views for the app.
 This file contains the view functions that handle requests and responses
 """
 import json
-from django.http import JsonResponse, HttpResponse
+from django.http import JsonResponse, HttpResponse, StreamingHttpResponse
 from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_GET, require_POST
 from django.shortcuts import get_object_or_404
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
 from django.contrib.auth.models import User
 from .models import Organization, Auditor, Audit, Measurement
+from . import codec, jobs, maptiles, negotiation
+from .cache import CacheBackend
+from .chunkcache import BlockStore, CachedHTTPFileSystem
+from .earthdata import EarthdataSession, is_auth_error
+from .jobs import JobStore
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework_simplejwt.views import TokenObtainPairView
+from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from rest_framework.permissions import AllowAny
 from rest_framework import status
 from django.contrib.auth import authenticate
 from rest_framework.authtoken.models import Token
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.exceptions import AuthenticationFailed
+import asyncio
+from asgiref.sync import sync_to_async
+import base64
 import earthaccess
+import functools
+from earthaccess.results import DataGranule
 import hashlib
 import json
 import logging
 import numpy as np
 import os
 import redis
+import threading
+import time
 import xarray as xr
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
 from datetime import datetime, timezone, timedelta
 
 # Utility: parse request body safely
@@ -384,29 +402,130 @@ def measurement_detail(request, pk):
 # --- Configuration ---
 REDIS_HOST = os.environ.get('REDIS_HOST', 'localhost')
 REDIS_PORT = int(os.environ.get('REDIS_PORT', 6379))
+REDIS_MAX_CONNECTIONS = int(os.environ.get('REDIS_MAX_CONNECTIONS', 50))  # per process
+REDIS_SOCKET_TIMEOUT = float(os.environ.get('REDIS_SOCKET_TIMEOUT', 5))  # seconds
+CACHE_LOCAL_MAX_BYTES = int(os.environ.get('CACHE_LOCAL_MAX_BYTES', 64 * 1024 * 1024))  # in-process tier size
+CACHE_LOCAL_TTL = int(os.environ.get('CACHE_LOCAL_TTL', 60))  # max seconds a local copy of a Redis entry is used
 CACHE_EXPIRY = int(os.environ.get('CACHE_EXPIRY', 3600))  # 1 hour default
+CACHE_EXPIRY_PAST = int(os.environ.get('CACHE_EXPIRY_PAST', 30 * 24 * 3600))  # past windows, 0 keeps them forever
+CACHE_STALE_EXPIRY = int(os.environ.get('CACHE_STALE_EXPIRY', 24 * 3600))  # how long expired entries are still served
+CACHE_REFRESH_WORKERS = int(os.environ.get('CACHE_REFRESH_WORKERS', 2))  # background refreshes per process
+GRANULE_CACHE_EXPIRY = int(os.environ.get('GRANULE_CACHE_EXPIRY', 30 * 24 * 3600))  # past windows, 30 days default
+GRANULE_CACHE_EXPIRY_RECENT = int(os.environ.get('GRANULE_CACHE_EXPIRY_RECENT', 600))  # windows touching today
+SINGLE_FLIGHT_LOCK_TIMEOUT = int(os.environ.get('SINGLE_FLIGHT_LOCK_TIMEOUT', 300))  # seconds, frees locks of crashed workers
+SINGLE_FLIGHT_WAIT = int(os.environ.get('SINGLE_FLIGHT_WAIT', 120))  # seconds to wait for another worker's fetch
+SINGLE_FLIGHT_POLL_INTERVAL = 0.25  # seconds between cache checks while waiting
+TILE_SIZE = float(os.environ.get('TILE_SIZE', 0.5))  # degrees per side of a cached tile
+NASA_REQUEST_WORKERS = int(os.environ.get('NASA_REQUEST_WORKERS', 16))  # NASA requests handled at once per process
+TEMPO_FETCH_WORKERS = int(os.environ.get('TEMPO_FETCH_WORKERS', 9))  # concurrent dataset opens
+TEMPO_FETCH_TIMEOUT = int(os.environ.get('TEMPO_FETCH_TIMEOUT', 120))  # seconds per fetch task, once it runs
+TEMPO_FETCH_QUEUE_TIMEOUT = int(os.environ.get('TEMPO_FETCH_QUEUE_TIMEOUT', 120))  # seconds to wait for a free fetch slot
+RANGE_CHUNK_WORKERS = int(os.environ.get('RANGE_CHUNK_WORKERS', 2))  # days of a date range fetched at once
+CHUNK_CACHE_DIR = os.environ.get('CHUNK_CACHE_DIR', '/code/data/chunk-cache')  # on the nasa_db volume
+CHUNK_CACHE_MAX_BYTES = int(os.environ.get('CHUNK_CACHE_MAX_BYTES', 10 * 1024 ** 3))  # 10 GB default, 0 disables it
+CHUNK_CACHE_BLOCK_SIZE = int(os.environ.get('CHUNK_CACHE_BLOCK_SIZE', 256 * 1024))  # bytes per cached block
+MAP_TILE_MIN_ZOOM = int(os.environ.get('MAP_TILE_MIN_ZOOM', 6))  # lower zooms span too many cached tiles
+MAP_TILE_MAX_ZOOM = 18
+MAP_TILE_CACHE_DIR = os.environ.get('MAP_TILE_CACHE_DIR', '/code/data/tile-cache')  # on the nasa_db volume
+MAP_TILE_CACHE_MAX_BYTES = int(os.environ.get('MAP_TILE_CACHE_MAX_BYTES', 1024 ** 3))  # 1 GB default, 0 disables it
+MAP_TILE_PADDING = 0.1  # degrees of data loaded around a map tile
+HTTP_MAX_AGE_FOREVER = 365 * 24 * 3600  # browser cache lifetime of responses kept forever
+# Part of the ETags of map responses, bump it when their content changes for the same parameters
+MAP_RESPONSE_VERSION = 1
+MAP_LOD_PIXELS_PER_CELL = 4  # screen pixels per map cell below which zoom coarsens map_data
+MAP_LOD_MAX_ZOOM = 24
+MAP_BATCH_MAX_LOCATIONS = int(os.environ.get('MAP_BATCH_MAX_LOCATIONS', 200))  # locations per batch map request
+JOB_EXPIRY = int(os.environ.get('JOB_EXPIRY', 24 * 3600))  # seconds jobs and their results are kept
+JOB_VISIBILITY_TIMEOUT = int(os.environ.get('JOB_VISIBILITY_TIMEOUT', 300))  # seconds before a job of a dead worker is requeued
+JOB_MAX_ATTEMPTS = int(os.environ.get('JOB_MAX_ATTEMPTS', 3))  # runs of an interrupted job before it fails
+JOB_EVENTS_POLL_INTERVAL = 1  # seconds between status checks of a job event stream
+
+# TEMPO products served by the API: the collection, the group and variable
+# of its column, the units of the column and the default color scale of its
+# map tiles. Products are searched, loaded, aggregated and returned from
+# this registry alone.
+PRODUCTS = {
+    "NO2": {
+        "short_name": "TEMPO_NO2_L3",
+        "group": "product",
+        "variable": "vertical_column_troposphere",
+        "units": "molecules/cm^2",
+        "color_range": (0, 1.5e16),
+    },
+    "HCHO": {
+        "short_name": "TEMPO_HCHO_L3",
+        "group": "product",
+        "variable": "vertical_column",
+        "units": "molecules/cm^2",
+        "color_range": (0, 3e16),
+    },
+    "O3": {
+        "short_name": "TEMPO_O3_L3",
+        "group": "product",
+        "variable": "vertical_column_troposphere",
+        "units": "molecules/cm^2",
+        "color_range": (0, 1.5e18),
+    },
+}
+
+# Formats of map_data: [longitude, latitude, value] triples, or a dense grid
+# with its origin and step
+MAP_FORMAT_TRIPLES = "triples"
+MAP_FORMAT_GRID = "grid"
+MAP_FORMATS = (MAP_FORMAT_TRIPLES, MAP_FORMAT_GRID)
+# Internal formats of binary responses: grid values as raw bytes, and cell
+# arrays for the Arrow columns
+MAP_FORMAT_GRID_BINARY = "grid_binary"
+MAP_FORMAT_CELLS = "cells"
 
 # Setup logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 # --- Initialization ---
-# Connect to Redis instance
-try:
-    cache = redis.Redis(host=REDIS_HOST, port=REDIS_PORT, db=0)
-    cache.ping()
-    logger.info("Successfully connected to Redis")
-except Exception as e:
-    logger.warning(f"Could not connect to Redis: {e}. Caching will be disabled.")
-    cache = None
-
-# Earth Access for NASA TEMPO data
-auth = earthaccess.login()
-if not auth.authenticated:
-    auth = earthaccess.login(strategy='netrc')
-
-if not auth.authenticated:
-    raise RuntimeError("Authentication failed. Please check your Earthdata credentials.")
+# Redis cache with a local LRU tier; connects lazily on first use
+cache = CacheBackend(
+    REDIS_HOST, REDIS_PORT, db=0,
+    max_connections=REDIS_MAX_CONNECTIONS,
+    socket_timeout=REDIS_SOCKET_TIMEOUT,
+    local_max_bytes=CACHE_LOCAL_MAX_BYTES,
+    local_ttl=CACHE_LOCAL_TTL,
+)
+
+# Pool for the blocking part of the async NASA endpoints
+request_executor = ThreadPoolExecutor(max_workers=NASA_REQUEST_WORKERS, thread_name_prefix="nasa-request")
+
+# Pool for refreshing stale cache entries off the request path
+refresh_executor = ThreadPoolExecutor(max_workers=CACHE_REFRESH_WORKERS, thread_name_prefix="cache-refresh")
+
+# Shared pool for the network-bound dataset opens, bounded per process
+fetch_executor = ThreadPoolExecutor(max_workers=TEMPO_FETCH_WORKERS, thread_name_prefix="tempo-fetch")
+
+# Local disk cache of granule byte ranges, shared by the workers through the data volume
+chunk_store = BlockStore(
+    CHUNK_CACHE_DIR, CHUNK_CACHE_MAX_BYTES, block_size=CHUNK_CACHE_BLOCK_SIZE
+) if CHUNK_CACHE_MAX_BYTES > 0 else None
+
+# Local disk cache of rendered map tiles of past days
+map_tile_store = BlockStore(
+    MAP_TILE_CACHE_DIR, MAP_TILE_CACHE_MAX_BYTES
+) if MAP_TILE_CACHE_MAX_BYTES > 0 else None
+
+# Earth Access for NASA TEMPO data, logged in on the first NASA request
+earthdata_session = EarthdataSession()
+
+# Queue and result store of the long running NASA jobs. Blocking pops wait
+# longer than the socket timeout of the cache pool, so they get a client
+# without one
+job_store = JobStore(
+    cache.client, expiry=JOB_EXPIRY,
+    blocking_client=redis.Redis(
+        host=REDIS_HOST, port=REDIS_PORT, db=0,
+        socket_connect_timeout=REDIS_SOCKET_TIMEOUT, socket_keepalive=True,
+    ),
+    visibility_timeout=JOB_VISIBILITY_TIMEOUT,
+    max_attempts=JOB_MAX_ATTEMPTS,
+)
 
 # --- Helper Functions ---
 
@@ -422,30 +541,59 @@ def generate_cache_key(params):
     params_str = json.dumps(rounded_params, sort_keys=True)
     return hashlib.md5(params_str.encode()).hexdigest()
 
-def get_from_cache(key):
-    """Retrieve data from Redis cache"""
-    if cache is None:
-        logger.debug("Cache is disabled (Redis not connected)")
-        return None
+def decode_cache_entry(data):
+    """Decode an entry written by save_to_cache, or None if missing or of an older format"""
+    if data and codec.is_encoded(data):
+        entry = codec.decode(data)
+        if isinstance(entry, dict) and 'fresh_until' in entry:
+            return entry
+    return None
+
+def get_cache_entry(key):
+    """
+    Retrieve data from Redis cache along with its staleness.
+
+    Returns (data, stale), where stale is True once the entry is past its
+    soft expiry but still within its hard one. Returns (None, False) on a
+    miss. A stale entry is read again from Redis, skipping the local tier,
+    whose copy may predate a refresh by another worker.
+    """
     try:
-        data = cache.get(key)
-        if data:
-            logger.info(f"Cache HIT for key: {key}")
-            return json.loads(data)
-        else:
-            logger.info(f"Cache MISS for key: {key}")
+        entry = decode_cache_entry(cache.get(key))
+        if entry is not None and entry['fresh_until'] is not None and time.time() > entry['fresh_until']:
+            entry = decode_cache_entry(cache.get(key, local=False)) or entry
+        if entry is not None:
+            stale = entry['fresh_until'] is not None and time.time() > entry['fresh_until']
+            logger.info(f"Cache {'STALE ' if stale else ''}HIT for key: {key}")
+            return entry['data'], stale
+        # Entries written in an older format count as misses
+        logger.info(f"Cache MISS for key: {key}")
     except Exception as e:
         logger.error(f"Error reading from cache: {e}")
-    return None
+    return None, False
 
-def save_to_cache(key, data, expiry=CACHE_EXPIRY):
-    """Save data to Redis cache"""
-    if cache is None:
-        return
+def get_from_cache(key):
+    """Retrieve data from Redis cache, fresh or stale"""
+    data, _ = get_cache_entry(key)
+    return data
+
+def save_to_cache(key, data, expiry=CACHE_EXPIRY, stale_expiry=CACHE_STALE_EXPIRY):
+    """
+    Save data to Redis cache, encoded with the binary cache codec.
+
+    The entry is fresh for expiry seconds and then served as stale for
+    stale_expiry more seconds while it is refreshed. An expiry of None keeps
+    the entry forever.
+    """
     try:
+        entry = {
+            'fresh_until': None if expiry is None else time.time() + expiry,
+            'data': data,
+        }
+
         # Check the size of the data before caching
-        json_data = json.dumps(data)
-        data_size = len(json_data)
+        encoded_data = codec.encode(entry)
+        data_size = len(encoded_data)
         logger.info(f"Attempting to cache {data_size} bytes with key: {key}")
         
         # Redis has a max value size (default 512MB, but large values are slow)
@@ -453,11 +601,108 @@ def save_to_cache(key, data, expiry=CACHE_EXPIRY):
         if data_size > 10_000_000:  # 10MB
             logger.warning(f"Cache data is very large ({data_size} bytes), this may be slow")
         
-        cache.setex(key, expiry, json_data)
+        cache.set(key, encoded_data, None if expiry is None else expiry + stale_expiry)
         logger.info(f"Successfully saved to cache with key: {key}")
     except Exception as e:
         logger.error(f"Error saving to cache: {e}")
 
+def cache_expiry_for_window(end_date):
+    """
+    Soft expiry for data of a time window.
+
+    Satellite data of past windows never changes, so it is kept for
+    CACHE_EXPIRY_PAST (forever when 0). Windows reaching today may still get
+    new granules and use CACHE_EXPIRY.
+    """
+    if window_touches_today(end_date):
+        return CACHE_EXPIRY
+    return CACHE_EXPIRY_PAST or None
+
+def refresh_in_background(key, refresh):
+    """
+    Run refresh() on the refresh pool to replace a stale cache entry.
+
+    A Redis lock makes sure only one worker refreshes a given key; refresh()
+    is expected to save the new entry itself.
+    """
+    # Released from the refresh thread, so the lock token can't be thread-local
+    lock = cache.lock(f"refresh:{key}", timeout=SINGLE_FLIGHT_LOCK_TIMEOUT, thread_local=False)
+    if lock is None:
+        # Without Redis the stale entry is served until it expires
+        return
+    try:
+        if not lock.acquire(blocking=False):
+            return
+    except Exception as e:
+        logger.error(f"Error acquiring refresh lock for key {key}: {e}")
+        return
+
+    def run():
+        try:
+            logger.info(f"Refreshing stale cache entry: {key}")
+            refresh()
+        except Exception as e:
+            logger.error(f"Error refreshing cache entry {key}: {e}", exc_info=True)
+        finally:
+            try:
+                lock.release()
+            except Exception as e:
+                logger.warning(f"Error releasing refresh lock for key {key}: {e}")
+
+    refresh_executor.submit(run)
+
+def single_flight(lock_key, ready, compute):
+    """
+    Run compute() in only one worker at a time for the same key.
+
+    The worker that takes the Redis lock runs compute(), which is expected to
+    save its result to the cache. Other workers poll ready() until it returns
+    the freshly cached result. If the lock is released without a result
+    (e.g. the fetch failed) a waiter takes over, and the lock expires after
+    SINGLE_FLIGHT_LOCK_TIMEOUT so a crashed worker cannot block the key. A
+    waiter that runs out of SINGLE_FLIGHT_WAIT computes the result itself.
+    """
+    lock = cache.lock(f"lock:{lock_key}", timeout=SINGLE_FLIGHT_LOCK_TIMEOUT)
+    if lock is None:
+        return compute()
+
+    deadline = time.monotonic() + SINGLE_FLIGHT_WAIT
+    while True:
+        try:
+            acquired = lock.acquire(blocking=False)
+        except Exception as e:
+            logger.error(f"Error acquiring lock for key {lock_key}: {e}")
+            return compute()
+
+        if acquired:
+            try:
+                # Another worker may have finished between our miss and the lock
+                result = ready()
+                if result is not None:
+                    return result
+                return compute()
+            finally:
+                try:
+                    lock.release()
+                except redis.exceptions.LockError:
+                    logger.warning(f"Lock for key {lock_key} expired before the fetch finished")
+                except Exception as e:
+                    logger.error(f"Error releasing lock for key {lock_key}: {e}")
+
+        logger.info(f"Waiting for in-flight fetch of key: {lock_key}")
+        while time.monotonic() < deadline and cache.exists(lock.name):
+            time.sleep(SINGLE_FLIGHT_POLL_INTERVAL)
+            result = ready()
+            if result is not None:
+                return result
+
+        result = ready()
+        if result is not None:
+            return result
+        if time.monotonic() >= deadline:
+            logger.warning(f"Gave up waiting for key {lock_key}, fetching it here")
+            return compute()
+
 def lat_lon_to_bounds(lat, lon, radius_km=10):
     """
     Convert lat/lon and radius to bounding box.
@@ -471,144 +716,1517 @@ def lat_lon_to_bounds(lat, lon, radius_km=10):
     
     return lat_bounds, lon_bounds
 
-def fetch_tempo_data(lat_bounds, lon_bounds, start_date, end_date, count=10):
-    """Fetch TEMPO NO2, HCHO, and O3 data for given bounds and time range"""
+TEMPO_VERSION = "V03"
+
+def window_touches_today(end_date):
+    """Whether a temporal window ends today or later (UTC), so new granules may still appear"""
+    if isinstance(end_date, str):
+        end_date = datetime.fromisoformat(end_date)
+    return end_date.date() >= datetime.now(timezone.utc).date()
+
+def search_granules(short_name, start_date, end_date, count, version=TEMPO_VERSION):
+    """
+    Search granules with earthaccess, caching the results.
+
+    The granule list of a window depends only on the collection and time, not
+    on the location, so it is shared by every request for that window. Past
+    windows never change and are kept for GRANULE_CACHE_EXPIRY; windows that
+    reach today use the much shorter GRANULE_CACHE_EXPIRY_RECENT.
+    """
+    cache_key = generate_cache_key({
+        'short_name': short_name,
+        'version': version,
+        'start': start_date,
+        'end': end_date,
+        'count': count,
+        'endpoint': 'granule_search'
+    })
+    cached = get_from_cache(cache_key)
+    if cached is not None:
+        return [
+            DataGranule(granule['collection'], cloud_hosted=granule['cloud_hosted'])
+            for granule in cached
+        ]
+
+    results = earthaccess.search_data(
+        short_name=short_name,
+        version=version,
+        temporal=(start_date, end_date),
+        count=count,
+    )
+
+    if window_touches_today(end_date):
+        expiry = GRANULE_CACHE_EXPIRY_RECENT
+    else:
+        expiry = GRANULE_CACHE_EXPIRY
+    save_to_cache(
+        cache_key,
+        [{'collection': dict(granule), 'cloud_hosted': granule.cloud_hosted} for granule in results],
+        expiry=expiry,
+        stale_expiry=0
+    )
+    return results
+
+def granule_start(granule):
+    """Start time of a granule as a naive UTC datetime, or None if unknown"""
+    try:
+        start = granule['umm']['TemporalExtent']['RangeDateTime']['BeginningDateTime']
+        start = datetime.fromisoformat(start.replace('Z', '+00:00'))
+    except (KeyError, TypeError, ValueError):
+        return None
+    if start.tzinfo is not None:
+        start = start.astimezone(timezone.utc).replace(tzinfo=None)
+    return start
+
+# Quality flag stored next to the column of every product. Pixels with
+# another value of the flag are masked out.
+QUALITY_FLAG = "main_data_quality_flag"
+
+TEMPO_OPEN_OPTIONS = {
+    "access": "indirect",  # access to cloud data (faster in AWS with "direct")
+    "load": False,  # Loaded by open_tempo_group, through the chunk cache
+    "concat_dim": "time",  # Concatenate files along the time dimension
+    "data_vars": "minimal",  # Only load data variables that include the concat_dim
+    "coords": "minimal",  # Only load coordinate variables that include the concat_dim
+    "compat": "override",  # Avoid coordinate conflicts by picking the first
+    "combine_attrs": "override",  # Avoid attribute conflicts by picking the first
+}
+
+def tempo_storage_options():
+    """
+    Storage options for reading the granule chunks of a virtual dataset.
+
+    Byte ranges are read through the local chunk cache when it is enabled.
+    A new filesystem is made for each dataset, as it binds its HTTP session
+    to the event loop of the reads.
+    """
+    https_fs = earthaccess.get_fsspec_https_session()
+    if chunk_store is None:
+        return {"remote_protocol": "https", "remote_options": https_fs.storage_options}
+    return {"fs": CachedHTTPFileSystem(
+        block_store=chunk_store,
+        asynchronous=True,
+        skip_instance_cache=True,
+        **https_fs.storage_options
+    )}
+
+def select_variables(variables, virtual_ds):
+    """Keep only the given variables of the virtual dataset of a granule"""
+    return virtual_ds[variables]
+
+def open_tempo_group(product_name, results, group, variables=None):
+    """
+    Open one group of the given granules as a dataset.
+
+    With variables, the other variables of the group are dropped from each
+    granule before the granules are combined, so they are never referenced
+    nor read. The virtual dataset is turned into in-memory kerchunk
+    references, so concurrent opens of the same collection and group don't
+    share a reference file on disk.
+    """
+    logger.info(f"    Opening {product_name} {group or 'root'} dataset...")
+    options = dict(TEMPO_OPEN_OPTIONS)
+    if group is not None:
+        options['group'] = group
+    if variables is not None:
+        options['preprocess'] = functools.partial(select_variables, variables)
+    virtual_ds = earthaccess.open_virtual_mfdataset(granules=results, **options)
+    references = virtual_ds.virtualize.to_kerchunk(format="dict")
+    return xr.open_dataset(references, engine="kerchunk", storage_options=tempo_storage_options())
+
+def fetch_tempo_product(product_name, regions, start_date, end_date, count, deadline=None):
+    """
+    Search, open and subset a single TEMPO product for several regions.
+
+    The root group, which holds the coordinates, and the group of the
+    product's column are opened concurrently on the shared fetch executor.
+    Only the column and its quality flag are loaded from the latter. The
+    granules are opened once and every (lat_bounds, lon_bounds) region is
+    subset from the same datasets. deadline bounds the opens, see
+    run_fetch_tasks. Returns a list with the subset of each region, or None
+    if no granules are found.
+    """
+    product = PRODUCTS[product_name]
+    logger.info(f"Processing {product_name} ({product['short_name']})...")
+    
+    # Search data granules
+    results = search_granules(product['short_name'], start_date, end_date, count)
+    
+    # A granule overlapping the start of the window belongs to the previous one
+    window_start = datetime.strptime(start_date, "%Y-%m-%d %H:%M")
+    results = [
+        granule for granule in results
+        if (granule_start(granule) or window_start) >= window_start
+    ]
+    
+    logger.info(f"  Number of {product_name} granules found: {len(results)}")
+    
+    if len(results) == 0:
+        logger.warning(f"No {product_name} granules found for the specified parameters")
+        return None
+    
+    logger.info(f"  Opening {product_name} datasets...")
+    root_ds, product_ds = run_fetch_tasks([
+        (open_tempo_group, product_name, results, None),
+        (open_tempo_group, product_name, results, product['group'], [product['variable'], QUALITY_FLAG]),
+    ], deadline)
+    
+    subsets = []
+    for lat_bounds, lon_bounds in regions:
+        subset_ds = subset_tempo_groups(product_name, root_ds, product_ds, lat_bounds, lon_bounds)
+        logger.info(f"  {product_name} subset complete. Data shape: {subset_ds.dims}")
+        subsets.append(subset_ds)
+    return subsets
+
+def fetch_tempo_product_logged_in(product_name, regions, start_date, end_date, count, deadline=None):
+    """
+    fetch_tempo_product, logging in again and retrying once if Earthdata
+    rejects the token, e.g. because it was revoked before it expired.
+    """
+    started = time.monotonic()
+    try:
+        return fetch_tempo_product(product_name, regions, start_date, end_date, count, deadline)
+    except Exception as e:
+        if not is_auth_error(e):
+            raise
+        logger.warning(f"Earthdata rejected the token fetching {product_name}, logging in again: {e}")
+    earthdata_session.invalidate(since=started)
+    earthdata_session.ensure()
+    return fetch_tempo_product(product_name, regions, start_date, end_date, count, deadline)
+
+def run_fetch_tasks(tasks, deadline=None):
+    """
+    Run (func, *args) tasks on the shared fetch executor, returning their results.
+
+    Each task has TEMPO_FETCH_TIMEOUT seconds from when it starts running,
+    so time queued behind other requests doesn't count against it, and the
+    wait for a free slot is bounded by TEMPO_FETCH_QUEUE_TIMEOUT. deadline,
+    a time.monotonic() value, bounds the whole request. Once the caller
+    stops waiting or the deadline passes, tasks that haven't started are
+    skipped, so an abandoned request takes no more slots; tasks already
+    running can't be stopped. Raises FutureTimeoutError on a timeout.
+    """
+    deadline = float('inf') if deadline is None else deadline
+    abandoned = threading.Event()
+
+    def run(started, func, *args):
+        if abandoned.is_set() or time.monotonic() >= deadline:
+            raise FutureTimeoutError("The request stopped waiting before the task started")
+        started['at'] = time.monotonic()
+        started['event'].set()
+        return func(*args)
+
+    tasks = [({'event': threading.Event()}, task) for task in tasks]
+    futures = [fetch_executor.submit(run, started, *task) for started, task in tasks]
+    queue_deadline = min(time.monotonic() + TEMPO_FETCH_QUEUE_TIMEOUT, deadline)
+    try:
+        results = []
+        for (started, _), future in zip(tasks, futures):
+            if not started['event'].wait(timeout=max(0, queue_deadline - time.monotonic())):
+                raise FutureTimeoutError("No free fetch slot before the request timed out")
+            task_deadline = min(started['at'] + TEMPO_FETCH_TIMEOUT, deadline)
+            results.append(future.result(timeout=max(0, task_deadline - time.monotonic())))
+        return results
+    finally:
+        abandoned.set()
+        for future in futures:
+            future.cancel()
+
+def subset_tempo_groups(product_name, root_ds, product_ds, lat_bounds, lon_bounds):
+    """
+    Subset the groups of a product to the bounds, then merge them.
+
+    The bounds are located in the coordinates of the root group and the same
+    positional slices are applied to the product group, of which only the
+    column and the quality flag are kept. Nothing outside the bounds is
+    merged or read from the granules.
+    """
+    var_name = PRODUCTS[product_name]['variable']
+    lat_slice = root_ds.indexes["latitude"].slice_indexer(lat_bounds[0], lat_bounds[1])
+    lon_slice = root_ds.indexes["longitude"].slice_indexer(lon_bounds[0], lon_bounds[1])
+    
+    logger.info(f"  Subsetting {product_name} by location...")
+    coords_ds = root_ds.drop_vars(list(root_ds.data_vars)).isel(latitude=lat_slice, longitude=lon_slice)
+    variables_ds = product_ds[[var_name, QUALITY_FLAG]].isel(latitude=lat_slice, longitude=lon_slice)
+    
+    # Merge datasets
+    logger.info(f"  Merging {product_name} datasets...")
+    subset_ds = xr.merge([coords_ds, variables_ds])
+    
+    logger.info(f"  Masking {product_name} by quality...")
+    return subset_ds.where(subset_ds[QUALITY_FLAG] == 0)
+
+class TempoFetchError(RuntimeError):
+    """Some TEMPO products could not be fetched, as opposed to having no granules"""
+
+    def __init__(self, products):
+        self.products = products
+        super().__init__(f"Failed to fetch TEMPO products: {', '.join(products)}")
+
+def fetch_tempo_data(lat_bounds, lon_bounds, start_date, end_date, count=10):
+    """
+    Fetch the TEMPO products of the registry for given bounds and time range.
+
+    Returns a dict mapping product name to its subset, or None if no product
+    was found. Raises TempoFetchError if a product could not be fetched, so
+    that a partial result is never cached. See fetch_tempo_regions.
+    """
+    region_datasets, failed = fetch_tempo_regions([(lat_bounds, lon_bounds)], start_date, end_date, count)
+    if failed:
+        raise TempoFetchError(failed)
+    return region_datasets[0] or None
+
+def fetch_tempo_regions(regions, start_date, end_date, count=10):
+    """
+    Fetch the TEMPO products of the registry for several regions at once.
+
+    Each product's granules are searched and opened once, whatever the
+    number of (lat_bounds, lon_bounds) regions, and the regions are subset
+    from the shared datasets. Products are fetched concurrently, so latency
+    is set by the slowest one. A product that fails or times out is left out
+    of the subsets: its search and its opens get TEMPO_FETCH_TIMEOUT each,
+    plus up to TEMPO_FETCH_QUEUE_TIMEOUT waiting for fetch slots. Returns a list with, for
+    each region, a dict mapping product name to its subset, and the list of
+    the products that failed, so that callers don't cache partial results.
+    """
+    
+    earthdata_session.ensure()
+    
+    logger.info(f"Searching for TEMPO data...")
+    logger.info(f"  Time range: {start_date} to {end_date}")
+    for lat_bounds, lon_bounds in regions:
+        logger.info(f"  Lat bounds: {lat_bounds}, lon bounds: {lon_bounds}")
+    logger.info(f"  Max granules: {count if count > 0 else 'all'}")
+    
+    region_datasets = [{} for _ in regions]
+    failed = []
+    
+    # Product tasks only wait on the shared pool, so they get their own
+    # short-lived threads to avoid starving it
+    product_executor = ThreadPoolExecutor(max_workers=len(PRODUCTS), thread_name_prefix="tempo-product")
+    deadline = time.monotonic() + TEMPO_FETCH_QUEUE_TIMEOUT + 2 * TEMPO_FETCH_TIMEOUT
+    try:
+        futures = {
+            product_name: product_executor.submit(
+                fetch_tempo_product_logged_in, product_name, regions, start_date, end_date, count, deadline
+            )
+            for product_name in PRODUCTS
+        }
+        for product_name, future in futures.items():
+            try:
+                subsets = future.result(timeout=max(0, deadline - time.monotonic()))
+            except FutureTimeoutError:
+                logger.error(f"Timed out fetching {product_name}")
+                failed.append(product_name)
+                continue
+            except Exception as e:
+                logger.error(f"Error fetching {product_name}: {e}", exc_info=True)
+                failed.append(product_name)
+                continue
+            if subsets is not None:
+                for all_datasets, subset_ds in zip(region_datasets, subsets):
+                    all_datasets[product_name] = subset_ds
+    finally:
+        # Don't block the request on a product that timed out
+        product_executor.shutdown(wait=False, cancel_futures=True)
+    
+    if not any(region_datasets) and not failed:
+        logger.warning("No datasets found for any product")
+    
+    return region_datasets, failed
+
+def reduce_products(all_datasets, with_time_series=False):
+    """
+    Reduce each product to its temporal mean grid, computed once.
+
+    Returns a dict mapping product name to the in-memory mean grid and the
+    number of time steps it was averaged over. Both the summary statistics
+    and the map output are derived from this grid.
+
+    With with_time_series, the per-timestep spatial mean/min/max are reduced
+    in the same graph, so each product is still evaluated only once.
+    """
+    reduced = {}
+    for product_name, subset_ds in all_datasets.items():
+        if product_name not in PRODUCTS:
+            continue
+        var_name = PRODUCTS[product_name]['variable']
+        if var_name not in subset_ds:
+            logger.warning(f"Variable {var_name} not found in {product_name} dataset")
+            continue
+
+        logger.info(f"Computing temporal mean for {product_name}...")
+        data = subset_ds[var_name]
+        reductions = {'mean_column': data.mean(dim="time")}
+        if with_time_series:
+            reductions.update(time_series_reductions(data))
+        computed = xr.Dataset(reductions).compute()
+
+        grid = {
+            'mean_column': computed['mean_column'],
+            'data_points': int(subset_ds.sizes.get('time', 0)),
+        }
+        if with_time_series:
+            grid['time_series'] = build_time_series(computed)
+        reduced[product_name] = grid
+    return reduced
+
+def time_series_reductions(data):
+    """Lazy per-timestep spatial mean/min/max of a product variable"""
+    if 'time' not in data.dims:
+        return {}
+    spatial_dims = [dim for dim in ('latitude', 'longitude') if dim in data.dims]
+    return {
+        'series_mean': data.mean(dim=spatial_dims),
+        'series_min': data.min(dim=spatial_dims),
+        'series_max': data.max(dim=spatial_dims),
+    }
+
+def aggregate_products(all_datasets):
+    """
+    Reduce each product to aggregates over its time steps.
+
+    Returns a dict mapping product name to in-memory sum, count, min and max
+    grids, the quality-filtered values per time step and the number of time
+    steps. Unlike means, the aggregates of consecutive chunks and adjacent
+    tiles combine exactly. subset_aggregates turns them into the input of
+    combine_aggregates.
+    """
+    aggregates = {}
+    for product_name, subset_ds in all_datasets.items():
+        if product_name not in PRODUCTS:
+            continue
+        var_name = PRODUCTS[product_name]['variable']
+        if var_name not in subset_ds:
+            logger.warning(f"Variable {var_name} not found in {product_name} dataset")
+            continue
+
+        logger.info(f"Computing aggregates for {product_name}...")
+        data = subset_ds[var_name]
+        computed = xr.Dataset({
+            'values': data,
+            'sum': data.sum(dim="time"),
+            'count': data.count(dim="time"),
+            'min': data.min(dim="time"),
+            'max': data.max(dim="time"),
+        }).compute()
+
+        aggregates[product_name] = {
+            # Sums of many column densities keep their precision in float64
+            'sum': computed['sum'].astype(np.float64),
+            'count': computed['count'],
+            'min': computed['min'],
+            'max': computed['max'],
+            'values': computed['values'].transpose('time', 'latitude', 'longitude'),
+            'data_points': int(subset_ds.sizes.get('time', 0)),
+        }
+    return aggregates
+
+def subset_aggregates(aggregates, lat_bounds, lon_bounds):
+    """
+    Select the aggregates of bounds and derive their time series.
+
+    The per-timestep values are only needed for the time series of the
+    exact bounds and are dropped from the result.
+    """
+    subset = {}
+    for product_name, aggregate in aggregates.items():
+        def select(grid):
+            return grid.sel(
+                latitude=slice(lat_bounds[0], lat_bounds[1]),
+                longitude=slice(lon_bounds[0], lon_bounds[1]),
+            )
+
+        values = select(aggregate['values'])
+        subset[product_name] = {
+            'sum': select(aggregate['sum']),
+            'count': select(aggregate['count']),
+            'min': select(aggregate['min']),
+            'max': select(aggregate['max']),
+            'data_points': aggregate['data_points'],
+            'time_series': build_time_series(xr.Dataset(time_series_reductions(values))),
+        }
+    return subset
+
+def combine_aggregates(totals, aggregates):
+    """
+    Add the aggregates of a later time chunk to running totals, in place.
+
+    Grids are aligned on their coordinates, so chunks whose subsets differ
+    slightly still combine cell by cell.
+    """
+    for product_name, chunk in aggregates.items():
+        total = totals.get(product_name)
+        if total is None:
+            totals[product_name] = dict(chunk, time_series=list(chunk['time_series']))
+            continue
+
+        total_sum, chunk_sum = xr.align(total['sum'], chunk['sum'], join='outer', fill_value=0)
+        total_count, chunk_count = xr.align(total['count'], chunk['count'], join='outer', fill_value=0)
+        total_min, chunk_min = xr.align(total['min'], chunk['min'], join='outer')
+        total_max, chunk_max = xr.align(total['max'], chunk['max'], join='outer')
+        total['sum'] = total_sum + chunk_sum
+        total['count'] = total_count + chunk_count
+        total['min'] = np.fmin(total_min, chunk_min)
+        total['max'] = np.fmax(total_max, chunk_max)
+        total['data_points'] += chunk['data_points']
+        total['time_series'].extend(chunk['time_series'])
+    return totals
+
+def finalize_aggregates(totals):
+    """
+    Turn running aggregates into reduced grids.
+
+    Returns the same structure as reduce_products with time series, the mean
+    of each cell being its sum over its count of valid time steps.
+    """
+    return {
+        product_name: {
+            'mean_column': (total['sum'] / total['count']).where(total['count'] > 0),
+            'data_points': total['data_points'],
+            'time_series': total['time_series'],
+        }
+        for product_name, total in totals.items()
+    }
+
+def aggregates_to_cache(aggregates):
+    """Serialize the aggregates of aggregate_products as raw arrays, like grid_to_cache"""
+    cached = {}
+    for product_name, aggregate in aggregates.items():
+        grids = {
+            name: aggregate[name].transpose('latitude', 'longitude')
+            for name in ('sum', 'count', 'min', 'max')
+        }
+        cached[product_name] = {
+            'latitude': np.asarray(grids['sum']['latitude'].values),
+            'longitude': np.asarray(grids['sum']['longitude'].values),
+            'time': np.asarray(aggregate['values']['time'].values),
+            'sum': np.asarray(grids['sum'].values, dtype=np.float64),
+            'count': np.asarray(grids['count'].values, dtype=np.int32),
+            'min': np.asarray(grids['min'].values, dtype=np.float32),
+            'max': np.asarray(grids['max'].values, dtype=np.float32),
+            'values': np.asarray(aggregate['values'].values, dtype=np.float32),
+            'data_points': aggregate['data_points'],
+        }
+    return cached
+
+def aggregates_from_cache(cached):
+    """Rebuild aggregates serialized with aggregates_to_cache"""
+    aggregates = {}
+    for product_name, data in cached.items():
+        coords = {'latitude': data['latitude'], 'longitude': data['longitude']}
+        shape = (len(data['latitude']), len(data['longitude']))
+        aggregate = {
+            name: xr.DataArray(
+                np.asarray(data[name]).reshape(shape), coords=coords, dims=('latitude', 'longitude')
+            )
+            for name in ('sum', 'count', 'min', 'max')
+        }
+        aggregate['values'] = xr.DataArray(
+            np.asarray(data['values']).reshape((len(data['time']),) + shape),
+            coords=dict(coords, time=data['time']),
+            dims=('time', 'latitude', 'longitude'),
+        )
+        aggregate['data_points'] = data['data_points']
+        aggregates[product_name] = aggregate
+    return aggregates
+
+def build_time_series(computed):
+    """Turn per-timestep reductions into the time series response format"""
+    if 'series_mean' not in computed:
+        return []
+    return [
+        {
+            'time': str(t),
+            'mean_value': float(mean_value),
+            'min_value': float(min_value),
+            'max_value': float(max_value)
+        }
+        for t, mean_value, min_value, max_value in zip(
+            computed['time'].values,
+            computed['series_mean'].values,
+            computed['series_min'].values,
+            computed['series_max'].values,
+        )
+    ]
+
+def summarize_grid(mean_column):
+    """Compute mean, min and max of an in-memory grid"""
+    return {
+        'mean': float(mean_column.mean().values),
+        'min': float(mean_column.min().values),
+        'max': float(mean_column.max().values),
+    }
+
+def tiles_for_bounds(lat_bounds, lon_bounds, tile_size=TILE_SIZE):
+    """
+    List the (row, col) indices of the fixed tiles overlapping the bounds.
+
+    The bounds are clamped to the globe first: near the poles the longitude
+    span of a radius grows without limit, and so would the list of tiles.
+    """
+    def indices(bounds, limit):
+        first = int(np.floor(max(bounds[0], -limit) / tile_size))
+        last = min(int(np.floor(min(bounds[1], limit) / tile_size)), int(np.ceil(limit / tile_size)) - 1)
+        return range(first, last + 1)
+
+    rows = indices(lat_bounds, 90)
+    cols = indices(lon_bounds, 180)
+    return [(row, col) for row in rows for col in cols]
+
+def tile_bounds(tile, tile_size=TILE_SIZE):
+    """Convert a (row, col) tile index to lat/lon bounds"""
+    row, col = tile
+    return (row * tile_size, (row + 1) * tile_size), (col * tile_size, (col + 1) * tile_size)
+
+def slice_tile(grid, tile, tile_size=TILE_SIZE):
+    """
+    Select the cells of a grid that belong to a tile.
+
+    Tiles are half-open so that a cell on a tile edge belongs to exactly one
+    tile.
+    """
+    lat_range, lon_range = tile_bounds(tile, tile_size)
+    lat = grid['latitude'].values
+    lon = grid['longitude'].values
+    return grid.isel(
+        latitude=np.flatnonzero((lat >= lat_range[0]) & (lat < lat_range[1])),
+        longitude=np.flatnonzero((lon >= lon_range[0]) & (lon < lon_range[1])),
+    )
+
+def grid_to_cache(grid):
+    """
+    Serialize a reduced lat x lon grid for the cache.
+
+    Values are kept as float32 arrays, which the cache codec stores as raw
+    buffers; coordinates keep their dtype so tiles stitch back exactly.
+    """
+    mean_column = grid['mean_column'].transpose('latitude', 'longitude')
+    return {
+        'latitude': np.asarray(mean_column['latitude'].values),
+        'longitude': np.asarray(mean_column['longitude'].values),
+        'values': np.asarray(mean_column.values, dtype=np.float32),
+        'data_points': grid['data_points'],
+    }
+
+def grid_from_cache(data):
+    """Rebuild a reduced grid serialized with grid_to_cache"""
+    mean_column = xr.DataArray(
+        np.asarray(data['values'], dtype=float).reshape(len(data['latitude']), len(data['longitude'])),
+        coords={'latitude': data['latitude'], 'longitude': data['longitude']},
+        dims=('latitude', 'longitude'),
+    )
+    return {'mean_column': mean_column, 'data_points': data['data_points']}
+
+def cache_response(cache_key, response_data, reduced, pyramids, expiry=CACHE_EXPIRY):
+    """
+    Cache a map response with its reduced grids instead of the map triples.
+
+    The triples are rebuilt from the grids by render_cached_response, so the
+    cache holds compact binary arrays rather than large JSON lists. The
+    coarser levels of each grid built by build_pyramid are stored next to it.
+    Returns the cached payload, so a fresh response can be rendered from the
+    same float32 grids as later cache hits.
+    """
+    cached = {
+        'response': {key: value for key, value in response_data.items() if key != 'map_data'},
+        'grids': {product_name: grid_to_cache(grid) for product_name, grid in reduced.items()},
+        'pyramids': {
+            product_name: [
+                grid_to_cache({'mean_column': level, 'data_points': reduced[product_name]['data_points']})
+                for level in pyramid
+            ]
+            for product_name, pyramid in pyramids.items()
+        },
+    }
+    save_to_cache(cache_key, cached, expiry=expiry)
+    return cached
+
+def render_cached_response(cached, map_format=MAP_FORMAT_TRIPLES, lod=None):
+    """
+    Rebuild a map response stored with cache_response.
+
+    map_data is rendered in map_format, at the level of detail chosen by lod.
+    """
+    response_data = dict(cached['response'])
+    pyramids = cached.get('pyramids', {})
+    map_data = {}
+    for product_name, grid in cached['grids'].items():
+        pyramid = pyramids.get(product_name)
+        if pyramid is not None:
+            pyramid = [grid_from_cache(level)['mean_column'] for level in pyramid]
+        mean_column = select_level(grid_from_cache(grid)['mean_column'], pyramid, lod)
+        map_data[product_name] = render_map_data(mean_column, map_format)
+    response_data['map_data'] = map_data
+    return response_data
+
+def tile_cache_key(tile, start_date, end_date):
+    """Generate the cache key of a tile for a time window"""
+    return generate_cache_key({
+        'tile': list(tile),
+        'tile_size': TILE_SIZE,
+        'start': start_date,
+        'end': end_date,
+        'endpoint': 'tile'
+    })
+
+def tiles_extent(tiles):
+    """Bounds covering a set of tiles"""
+    extents = [tile_bounds(tile) for tile in tiles]
+    lat_bounds = (min(lat[0] for lat, _ in extents), max(lat[1] for lat, _ in extents))
+    lon_bounds = (min(lon[0] for _, lon in extents), max(lon[1] for _, lon in extents))
+    return lat_bounds, lon_bounds
+
+def tile_clusters(tiles):
+    """Group tiles into clusters of adjacent tiles, diagonals included"""
+    remaining = set(tiles)
+    clusters = []
+    while remaining:
+        seed = min(remaining)
+        remaining.remove(seed)
+        cluster = [seed]
+        stack = [seed]
+        while stack:
+            row, col = stack.pop()
+            for neighbour in [(row + d_row, col + d_col) for d_row in (-1, 0, 1) for d_col in (-1, 0, 1)]:
+                if neighbour in remaining:
+                    remaining.remove(neighbour)
+                    cluster.append(neighbour)
+                    stack.append(neighbour)
+        clusters.append(sorted(cluster))
+    return clusters
+
+def fetch_tiles(tiles, start_date, end_date):
+    """
+    Fetch, reduce and cache the given tiles for a time window.
+
+    Each cluster of adjacent tiles is fetched as one region covering its
+    extent, and all regions share a single opening of the granules, so far
+    apart tiles don't pull in everything between them. Returns a dict
+    mapping each tile to its reduced grid per product.
+
+    Raises TempoFetchError, without caching any tile, when a product could
+    not be fetched.
+    """
+    clusters = tile_clusters(tiles)
+    region_datasets, failed = fetch_tempo_regions(
+        [tiles_extent(cluster) for cluster in clusters], start_date, end_date
+    )
+    if failed:
+        raise TempoFetchError(failed)
+
+    tile_data = {}
+    for cluster, all_datasets in zip(clusters, region_datasets):
+        reduced = reduce_products(all_datasets) if all_datasets else {}
+        for tile in cluster:
+            tile_data[tile] = {
+                product_name: {
+                    'mean_column': slice_tile(grid['mean_column'], tile),
+                    'data_points': grid['data_points'],
+                }
+                for product_name, grid in reduced.items()
+            }
+            save_to_cache(
+                tile_cache_key(tile, start_date, end_date),
+                {product_name: grid_to_cache(grid) for product_name, grid in tile_data[tile].items()},
+                expiry=cache_expiry_for_window(end_date)
+            )
+    return tile_data
+
+def tiles_lock_key(tiles, start_date, end_date, endpoint='tile_fetch'):
+    """Generate the lock key for fetching a set of tiles"""
+    return generate_cache_key({
+        'tiles': sorted(list(tile) for tile in tiles),
+        'tile_size': TILE_SIZE,
+        'start': start_date,
+        'end': end_date,
+        'endpoint': endpoint
+    })
+
+def get_tiled_products(lat_bounds, lon_bounds, start_date, end_date, serve_stale=True):
+    """
+    Get the reduced grid of each product for the bounds from the tile cache.
+
+    Grids are reduced and cached per fixed tile and time window instead of
+    per exact request, so nearby and overlapping requests share the work.
+    Missing tiles are fetched, then the overlapping tiles are stitched and
+    sliced to the bounds. Returns the same structure as reduce_products.
+    """
+    tiles = tiles_for_bounds(lat_bounds, lon_bounds)
+    return products_from_tiles(load_tiles(tiles, start_date, end_date, serve_stale), lat_bounds, lon_bounds)
+
+def load_tiles(tiles, start_date, end_date, serve_stale=True):
+    """
+    Get the reduced grids of tiles from the tile cache, fetching the missing ones.
+
+    Returns a dict mapping each tile to its reduced grid per product. See
+    load_cached_tiles for serve_stale.
+    """
+    return load_cached_tiles(
+        tiles,
+        lambda tile: tile_cache_key(tile, start_date, end_date),
+        lambda cached: {product_name: grid_from_cache(grid) for product_name, grid in cached.items()},
+        lambda tiles: fetch_tiles(tiles, start_date, end_date),
+        lambda tiles: tiles_lock_key(tiles, start_date, end_date),
+        serve_stale=serve_stale,
+    )
+
+def get_cached_tile_entries(tiles, cache_key, decode):
+    """
+    Get the decoded cache entries of the cached tiles among the given ones.
+
+    Returns the entries per tile and the list of tiles whose entry is stale.
+    """
+    tile_data = {}
+    stale_tiles = []
+    for tile in tiles:
+        cached, stale = get_cache_entry(cache_key(tile))
+        if cached is not None:
+            tile_data[tile] = decode(cached)
+            if stale:
+                stale_tiles.append(tile)
+    return tile_data, stale_tiles
+
+def load_cached_tiles(tiles, cache_key, decode, fetch, lock_key, serve_stale=True):
+    """
+    Get the cache entries of tiles, fetching the missing ones.
+
+    cache_key(tile) is the cache key of a tile and decode(cached) turns its
+    cached entry back into its data. fetch(tiles) fetches and caches tiles,
+    returning their data per tile, and lock_key(tiles) is the lock key of
+    fetching them. Stale tiles are served and refreshed in the background,
+    and missing tiles are fetched once across workers. Without serve_stale,
+    stale tiles are fetched like missing ones. Returns a dict mapping each
+    tile to its data.
+    """
+    def cached_tiles(tiles):
+        tile_data, stale_tiles = get_cached_tile_entries(tiles, cache_key, decode)
+        if not serve_stale:
+            for tile in stale_tiles:
+                del tile_data[tile]
+            stale_tiles = []
+        return tile_data, stale_tiles
+
+    tile_data, stale_tiles = cached_tiles(tiles)
+    missing = [tile for tile in tiles if tile not in tile_data]
+
+    if stale_tiles:
+        # Serve the stale tiles now and replace them off the request path
+        refresh_in_background(lock_key(stale_tiles), lambda: fetch(stale_tiles))
+
+    if missing:
+        def ready():
+            fetched, _ = cached_tiles(missing)
+            return fetched if len(fetched) == len(missing) else None
+
+        # Requests for the same area miss the same tiles; fetch them only once
+        logger.info(f"Fetching {len(missing)} of {len(tiles)} tiles")
+        tile_data.update(single_flight(lock_key(missing), ready, lambda: fetch(missing)))
+    return tile_data
+
+def products_from_tiles(tile_data, lat_bounds, lon_bounds):
+    """Stitch the loaded tiles overlapping the bounds and slice them to the bounds"""
+    tiles = tiles_for_bounds(lat_bounds, lon_bounds)
+    reduced = {}
+    for product_name in PRODUCTS:
+        pieces = [
+            tile_data[tile][product_name] for tile in tiles
+            if product_name in tile_data[tile] and tile_data[tile][product_name]['mean_column'].size > 0
+        ]
+        if len(pieces) == 0:
+            continue
+
+        merged = stitch_tiles([piece['mean_column'] for piece in pieces])
+        reduced[product_name] = {
+            'mean_column': merged.sel(
+                latitude=slice(lat_bounds[0], lat_bounds[1]),
+                longitude=slice(lon_bounds[0], lon_bounds[1]),
+            ),
+            'data_points': max(piece['data_points'] for piece in pieces),
+        }
+    return reduced
+
+def stitch_tiles(grids):
+    """Stitch the grids of adjacent tiles into one"""
+    # Tiles never overlap, so an outer merge just stitches them together
+    return xr.merge(
+        [grid.rename('grid') for grid in grids],
+        join='outer',
+        compat='no_conflicts'
+    )['grid']
+
+def aggregate_tile_cache_key(tile, day):
+    """Generate the cache key of the daily aggregates of a tile"""
+    return generate_cache_key({
+        'tile': list(tile),
+        'tile_size': TILE_SIZE,
+        'day': day.strftime("%Y-%m-%d"),
+        'endpoint': 'aggregate_tile'
+    })
+
+def day_window(day):
+    """Start and end of the UTC day of a datetime, as search strings"""
+    day_start = day.replace(hour=0, minute=0, second=0, microsecond=0)
+    # Same end of day as current_map_window
+    day_end = day_start + timedelta(days=1) - timedelta(minutes=1)
+    return day_start.strftime("%Y-%m-%d %H:%M"), day_end.strftime("%Y-%m-%d %H:%M")
+
+def fetch_aggregate_tiles(tiles, day):
+    """
+    Fetch and store the daily aggregates of the given tiles.
+
+    All tiles are fetched with a single request covering their extent, with
+    every granule of the day. Returns a dict mapping each tile to its
+    aggregates per product, as returned by aggregate_products.
+
+    Raises TempoFetchError, without storing any tile, when a product could
+    not be fetched.
+    """
+    start_str, end_str = day_window(day)
+
+    (all_datasets,), failed = fetch_tempo_regions([tiles_extent(tiles)], start_str, end_str, count=-1)
+    if failed:
+        raise TempoFetchError(failed)
+    aggregates = aggregate_products(all_datasets) if all_datasets else {}
+
+    tile_data = {}
+    for tile in tiles:
+        tile_data[tile] = {
+            product_name: dict(
+                {
+                    name: slice_tile(aggregate[name], tile)
+                    for name in ('sum', 'count', 'min', 'max', 'values')
+                },
+                data_points=aggregate['data_points'],
+            )
+            for product_name, aggregate in aggregates.items()
+        }
+        save_to_cache(
+            aggregate_tile_cache_key(tile, day),
+            aggregates_to_cache(tile_data[tile]),
+            expiry=cache_expiry_for_window(end_str)
+        )
+    return tile_data
+
+def get_daily_aggregates(lat_bounds, lon_bounds, day, serve_stale=True):
+    """
+    Get the aggregates of a UTC day for the bounds from the aggregate store.
+
+    Sum, count, min and max grids and the per-timestep values are stored per
+    tile and day, so any range covering the bounds is composed from stored
+    days and only the missing tiles and days are fetched. The mean grid is
+    derived from the sum and count when the days are combined. Returns the
+    stitched aggregates of the tiles covering the bounds, in the structure
+    of aggregate_products.
+    """
+    start_str, end_str = day_window(day)
+    tiles = tiles_for_bounds(lat_bounds, lon_bounds)
+    tile_data = load_cached_tiles(
+        tiles,
+        lambda tile: aggregate_tile_cache_key(tile, day),
+        aggregates_from_cache,
+        lambda tiles: fetch_aggregate_tiles(tiles, day),
+        lambda tiles: tiles_lock_key(tiles, start_str, end_str, endpoint='aggregate_tile_fetch'),
+        serve_stale=serve_stale,
+    )
+
+    aggregates = {}
+    for product_name in PRODUCTS:
+        pieces = [
+            tile_data[tile][product_name] for tile in tiles
+            if product_name in tile_data[tile] and tile_data[tile][product_name]['sum'].size > 0
+        ]
+        if len(pieces) == 0:
+            continue
+
+        aggregate = {
+            name: stitch_tiles([piece[name] for piece in pieces])
+            for name in ('sum', 'count', 'min', 'max', 'values')
+        }
+        # A tile without data leaves a hole, which adds nothing to the totals
+        aggregate['sum'] = aggregate['sum'].fillna(0)
+        aggregate['count'] = aggregate['count'].fillna(0)
+        aggregate['data_points'] = max(piece['data_points'] for piece in pieces)
+        aggregates[product_name] = aggregate
+    return aggregates
+
+def map_cells(data_array):
+    """
+    Flatten a grid into longitude, latitude and masked quantity arrays.
+
+    The grid is flattened with NumPy instead of walking every cell. Invalid
+    quantities are masked.
+    """
+    # Work with a lat x lon grid regardless of the dimension order
+    if {'latitude', 'longitude'}.issubset(data_array.dims):
+        data_array = data_array.transpose('latitude', 'longitude')
+
+    data_values = np.ma.masked_invalid(np.asarray(data_array.values, dtype=float))
+    lat_coords = np.atleast_1d(np.asarray(data_array.coords['latitude'].values, dtype=float))
+    lon_coords = np.atleast_1d(np.asarray(data_array.coords['longitude'].values, dtype=float))
+
+    if data_values.ndim == 1:
+        # 1D array - single dimension (either lat or lon)
+        size = min(data_values.shape[0], lat_coords.shape[0], lon_coords.shape[0])
+        lats = lat_coords[:size]
+        lons = lon_coords[:size]
+        quantities = data_values[:size]
+    else:
+        # 2D array - lat x lon grid
+        rows = min(data_values.shape[0], lat_coords.shape[0])
+        cols = min(data_values.shape[1], lon_coords.shape[0])
+        lons, lats = np.meshgrid(lon_coords[:cols], lat_coords[:rows])
+        quantities = data_values[:rows, :cols]
+
+    return lons.ravel(), lats.ravel(), quantities.ravel()
+
+def extract_map_data(data_array, drop_nan=False):
+    """
+    Extract map data as 3D array with [longitude, latitude, quantity] format.
+
+    Invalid cells get a null quantity, or are left out entirely when
+    drop_nan is set.
+    """
+    lons, lats, quantities = map_cells(data_array)
+    invalid = np.ma.getmaskarray(quantities)
+
+    if drop_nan:
+        valid = ~invalid
+        return np.column_stack((lons[valid], lats[valid], quantities.data[valid])).tolist()
+
+    result = np.column_stack((lons, lats, quantities.filled(0.0))).tolist()
+    for index in np.flatnonzero(invalid):
+        result[index][2] = None
+    return result
+
+def extract_map_cells(data_array):
+    """Extract the valid map cells as longitude, latitude and value arrays"""
+    lons, lats, quantities = map_cells(data_array)
+    valid = ~np.ma.getmaskarray(quantities)
+    return {'longitude': lons[valid], 'latitude': lats[valid], 'value': quantities.data[valid]}
+
+def extract_map_grid(data_array, binary=False):
+    """
+    Extract map data as a dense grid with its geotransform.
+
+    The quantities are a flat row-major latitude x longitude array of
+    little-endian float32, base64 encoded unless binary is set, with NaN for
+    invalid cells. Cell (i, j) is at origin + (i, j) * step. Coordinates
+    that are not evenly spaced are also listed explicitly.
+    """
+    if {'latitude', 'longitude'}.issubset(data_array.dims):
+        data_array = data_array.transpose('latitude', 'longitude')
+
+    lat_coords = np.atleast_1d(np.asarray(data_array.coords['latitude'].values, dtype=float))
+    lon_coords = np.atleast_1d(np.asarray(data_array.coords['longitude'].values, dtype=float))
+    values = np.asarray(data_array.values, dtype='<f4').reshape(len(lat_coords), len(lon_coords))
+
+    grid = {
+        'origin': [
+            float(lat_coords[0]) if len(lat_coords) else None,
+            float(lon_coords[0]) if len(lon_coords) else None,
+        ],
+        'step': [0.0, 0.0],
+        'shape': list(values.shape),
+        'dtype': 'float32',
+        'values': values.tobytes() if binary else base64.b64encode(values.tobytes()).decode('ascii'),
+    }
+    for axis, (name, coords) in enumerate((('latitude', lat_coords), ('longitude', lon_coords))):
+        if len(coords) < 2:
+            continue
+        step = (coords[-1] - coords[0]) / (len(coords) - 1)
+        grid['step'][axis] = float(step)
+        if not np.allclose(np.diff(coords), step, rtol=1e-3, atol=0):
+            grid[name] = coords.tolist()
+    return grid
+
+def parse_map_format(value):
+    """
+    Validate the format parameter of a map request.
+
+    Raises ValueError with a message for the client if it is unknown.
+    """
+    map_format = value or MAP_FORMAT_TRIPLES
+    if map_format not in MAP_FORMATS:
+        raise ValueError(f"format must be one of: {', '.join(MAP_FORMATS)}")
+    return map_format
+
+def render_map_data(data_array, map_format=MAP_FORMAT_TRIPLES):
+    """Map data of a grid in a requested or binary format, valid cells only for triples"""
+    if map_format == MAP_FORMAT_GRID:
+        return extract_map_grid(data_array)
+    if map_format == MAP_FORMAT_GRID_BINARY:
+        return extract_map_grid(data_array, binary=True)
+    if map_format == MAP_FORMAT_CELLS:
+        return extract_map_cells(data_array)
+    return extract_map_data(data_array, drop_nan=True)
+
+def render_format(map_format, media_type):
+    """
+    Format to render map_data in for a response media type.
+
+    Binary media types carry the arrays as they are: Arrow takes the cells
+    as columns and MessagePack takes grid values as raw bytes.
+    """
+    if media_type == negotiation.MEDIA_ARROW:
+        return MAP_FORMAT_CELLS
+    if media_type == negotiation.MEDIA_MSGPACK and map_format == MAP_FORMAT_GRID:
+        return MAP_FORMAT_GRID_BINARY
+    return map_format
+
+def coarsen_grid(mean_column, factor):
+    """
+    Block mean of a lat x lon grid over factor x factor cells.
+
+    Invalid cells are skipped, and partial blocks at the edges are averaged
+    over the cells they have. Coordinates are the centers of the blocks, so
+    the coarse grid stays evenly spaced.
+    """
+    coarse = mean_column.coarsen(latitude=factor, longitude=factor, boundary='pad').mean()
+    coords = {}
+    for name in ('latitude', 'longitude'):
+        values = np.asarray(mean_column[name].values, dtype=float)
+        if len(values) > 1:
+            step = np.median(np.diff(values))
+            coords[name] = values[0] + (np.arange(coarse.sizes[name]) * factor + (factor - 1) / 2) * step
+    return coarse.assign_coords(coords)
+
+def build_pyramid(mean_column):
+    """
+    Coarser levels of a grid, halving its resolution at each level.
+
+    Level n (index n - 1) is the block mean over 2^n x 2^n cells. Levels
+    stop once a level is a single cell.
+    """
+    pyramid = []
+    level = mean_column
+    factor = 1
+    while level.size > 1:
+        factor *= 2
+        level = coarsen_grid(mean_column, factor)
+        pyramid.append(level)
+    return pyramid
+
+def parse_lod_params(params):
+    """
+    Validate the level of detail parameters of a map request.
+
+    Returns a dict with max_points and zoom, or None if neither is given.
+    Raises ValueError with a message for the client if they are invalid.
+    """
+    max_points = params.get('max_points')
+    zoom = params.get('zoom')
+    if max_points is None and zoom is None:
+        return None
+    try:
+        max_points = None if max_points is None else int(max_points)
+        zoom = None if zoom is None else int(zoom)
+    except (TypeError, ValueError):
+        raise ValueError('max_points and zoom must be integers')
+    if max_points is not None and max_points < 1:
+        raise ValueError('max_points must be at least 1')
+    if zoom is not None and not (0 <= zoom <= MAP_LOD_MAX_ZOOM):
+        raise ValueError(f'zoom must be between 0 and {MAP_LOD_MAX_ZOOM}')
+    return {'max_points': max_points, 'zoom': zoom}
+
+def lod_level(mean_column, lod):
+    """
+    Pyramid level to render a grid at for the level of detail parameters.
+
+    max_points picks the finest level with at most that many cells. zoom
+    picks the coarsest level whose cells still span at most
+    MAP_LOD_PIXELS_PER_CELL screen pixels at that web mercator zoom. With
+    both, the coarser of the two wins.
+    """
+    if not lod:
+        return 0
+    rows, cols = mean_column.sizes['latitude'], mean_column.sizes['longitude']
+    level = 0
+    if lod['max_points'] is not None:
+        while rows * cols > lod['max_points'] and (rows > 1 or cols > 1):
+            rows, cols = -(-rows // 2), -(-cols // 2)
+            level += 1
+    longitudes = np.asarray(mean_column['longitude'].values, dtype=float)
+    if lod['zoom'] is not None and len(longitudes) > 1:
+        step = np.median(np.diff(longitudes))
+        # Degrees of longitude spanned by MAP_LOD_PIXELS_PER_CELL pixels of a 256 pixel tile
+        cell_size = MAP_LOD_PIXELS_PER_CELL * 360 / (maptiles.TILE_PIXELS * 2 ** lod['zoom'])
+        zoom_level = 0
+        while step * 2 ** (zoom_level + 1) <= cell_size:
+            zoom_level += 1
+        level = max(level, zoom_level)
+    return level
+
+def select_level(mean_column, pyramid, lod):
+    """
+    Grid at the level of detail chosen by lod.
+
+    pyramid holds the levels built by build_pyramid, or None to coarsen the
+    grid on the fly.
+    """
+    level = lod_level(mean_column, lod)
+    if level == 0:
+        return mean_column
+    if pyramid is None:
+        return coarsen_grid(mean_column, 2 ** level)
+    if not pyramid:
+        return mean_column
+    return pyramid[min(level, len(pyramid)) - 1]
+
+def get_cached_response(cache_key, refresh=None, map_format=MAP_FORMAT_TRIPLES, lod=None):
+    """
+    Get a map response stored with cache_response, or None on a miss.
+
+    A stale response is still returned; if refresh is given it is run in the
+    background to rebuild the entry. It is called with serve_stale=False, so
+    the rebuilt entry isn't assembled from tiles just as stale as it was.
+    """
+    cached_data, stale = get_cache_entry(cache_key)
+    if not cached_data:
+        return None
+    if stale and refresh is not None:
+        refresh_in_background(cache_key, functools.partial(refresh, serve_stale=False))
+    return render_cached_response(cached_data, map_format, lod)
+
+def current_map_window(now=None):
+    """
+    Time window served by get_current_map: this day a year ago.
+
+    The window is aligned to the UTC day so every request of the day shares
+    the same cached tiles; it rolls over at UTC midnight.
+    """
+    now = now or datetime.now(timezone.utc)
+    today = now.replace(hour=0, minute=0, second=0, microsecond=0)
+    start_date = today - timedelta(days=365)
+    end_date = start_date + timedelta(days=1) - timedelta(minutes=1)
+    return start_date, end_date
+
+def current_map_cache_key(lat, lon, start_date, end_date):
+    """Generate the response cache key of get_current_map (using date only, without time)"""
+    return generate_cache_key({
+        'lat': lat,
+        'lon': lon,
+        'start': start_date.strftime("%Y-%m-%d"),
+        'end': end_date.strftime("%Y-%m-%d"),
+        'endpoint': 'current_map'
+    })
+
+def build_current_map_response(cache_key, lat, lon, lat_bounds, lon_bounds, start_date, end_date,
+                               tile_data=None, map_format=MAP_FORMAT_TRIPLES, lod=None, serve_stale=True):
+    """
+    Build and cache the response of get_current_map from the tile cache.
+
+    tile_data can hold tiles already loaded with load_tiles, e.g. for a
+    batch of locations. map_data is rendered in map_format, at the level of
+    detail chosen by lod. Without serve_stale, stale tiles are fetched
+    again. Returns None if no data was found for the parameters.
+    """
+    start_str = start_date.strftime("%Y-%m-%d %H:%M")
+    end_str = end_date.strftime("%Y-%m-%d %H:%M")
+
+    # Assemble the reduced grids from the tile cache, fetching missing tiles
+    if tile_data is None:
+        reduced = get_tiled_products(lat_bounds, lon_bounds, start_str, end_str, serve_stale)
+    else:
+        reduced = products_from_tiles(tile_data, lat_bounds, lon_bounds)
+
+    if len(reduced) == 0:
+        return None
+
+    product_data = {}
+    pyramids = {}
+    for product_name, grid in reduced.items():
+        stats = summarize_grid(grid['mean_column'])
+        product_data[product_name] = {
+            'mean_value': stats['mean'],
+            'min_value': stats['min'],
+            'max_value': stats['max'],
+            'data_points': grid['data_points'],
+            'units': PRODUCTS[product_name]['units']
+        }
+
+        pyramids[product_name] = build_pyramid(grid['mean_column'])
     
-    logger.info(f"Searching for TEMPO data...")
-    logger.info(f"  Time range: {start_date} to {end_date}")
-    logger.info(f"  Lat bounds: {lat_bounds}")
-    logger.info(f"  Lon bounds: {lon_bounds}")
-    logger.info(f"  Max granules: {count}")
-    
-    products = {
-        "NO2": "TEMPO_NO2_L3",
-        "HCHO": "TEMPO_HCHO_L3",
-        "O3": "TEMPO_O3_L3"
+    # Prepare response
+    response_data = {
+        'latitude': lat,
+        'longitude': lon,
+        'radius_km': 10,
+        'start_date': start_date.isoformat(),
+        'end_date': end_date.isoformat(),
+        'products': product_data
     }
     
-    all_datasets = {}
-    
-    open_options = {
-        "access": "indirect",  # access to cloud data (faster in AWS with "direct")
-        "load": True,  # Load metadata immediately (required for indexing)
-        "concat_dim": "time",  # Concatenate files along the time dimension
-        "data_vars": "minimal",  # Only load data variables that include the concat_dim
-        "coords": "minimal",  # Only load coordinate variables that include the concat_dim
-        "compat": "override",  # Avoid coordinate conflicts by picking the first
-        "combine_attrs": "override",  # Avoid attribute conflicts by picking the first
-    }
+    # Cache the response, and render map_data from the cached grids like hits
+    cached = cache_response(cache_key, response_data, reduced, pyramids, expiry=cache_expiry_for_window(end_date))
     
-    for product_name, short_name in products.items():
-        logger.info(f"Processing {product_name} ({short_name})...")
-        
-        # Search data granules
-        results = earthaccess.search_data(
-            short_name=short_name,
-            version="V03",
-            temporal=(start_date, end_date),
-            count=count,
-        )
-        
-        logger.info(f"  Number of {product_name} granules found: {len(results)}")
-        
-        if len(results) == 0:
-            logger.warning(f"No {product_name} granules found for the specified parameters")
-            continue
-        
-        logger.info(f"  Opening {product_name} datasets...")
-        
-        logger.info(f"    Opening {product_name} root dataset...")
-        result_root = earthaccess.open_virtual_mfdataset(granules=results, **open_options)
-        
-        logger.info(f"    Opening {product_name} product dataset...")
-        result_product = earthaccess.open_virtual_mfdataset(
-            granules=results, group="product", **open_options
+    return render_cached_response(cached, map_format, lod)
+
+def day_chunks(start_date, end_date):
+    """
+    Split a time range at UTC day boundaries.
+
+    Returns (start, end, full_day) tuples, where full_day tells whether the
+    chunk covers its whole day rather than the partial edge of the range.
+    An end at midnight, e.g. a date-only end_date, adds no chunk for its day.
+    """
+    chunks = []
+    day = start_date.replace(hour=0, minute=0, second=0, microsecond=0)
+    while day <= end_date:
+        # Same end of day as current_map_window
+        day_end = day + timedelta(days=1) - timedelta(minutes=1)
+        chunk_start = max(start_date, day)
+        chunk_end = min(end_date, day_end)
+        if chunk_start < chunk_end:
+            chunks.append((chunk_start, chunk_end, chunk_start == day and chunk_end == day_end))
+        day += timedelta(days=1)
+    return chunks
+
+def fetch_chunk_aggregates(lat_bounds, lon_bounds, chunk_start, chunk_end, full_day, serve_stale=True):
+    """
+    Get the aggregates of one chunk of a date range for the bounds.
+
+    Whole days are composed from the daily aggregate tiles, so overlapping
+    ranges only fetch the days and tiles they don't share. Partial days at
+    the edges of a range are always fetched. All granules of the chunk are
+    used, without a count cap.
+    """
+    if full_day:
+        aggregates = get_daily_aggregates(lat_bounds, lon_bounds, chunk_start, serve_stale)
+    else:
+        all_datasets = fetch_tempo_data(
+            lat_bounds, lon_bounds,
+            chunk_start.strftime("%Y-%m-%d %H:%M"),
+            chunk_end.strftime("%Y-%m-%d %H:%M"),
+            count=-1
         )
-        
-        logger.info(f"    Opening {product_name} geolocation dataset...")
-        result_geolocation = earthaccess.open_virtual_mfdataset(
-            granules=results, group="geolocation", **open_options
+        aggregates = aggregate_products(all_datasets) if all_datasets else {}
+    return subset_aggregates(aggregates, lat_bounds, lon_bounds)
+
+def build_range_response(cache_key, lat, lon, lat_bounds, lon_bounds,
+                         start_date, end_date, start_date_str, end_date_str, progress=None,
+                         map_format=MAP_FORMAT_TRIPLES, lod=None, serve_stale=True):
+    """
+    Fetch, reduce and cache the response of get_data_range.
+
+    Returns None if no data was found for the parameters. progress, if
+    given, is called with a short message at each step. map_data is
+    rendered in map_format, at the level of detail chosen by lod. Without
+    serve_stale, stale daily aggregates are fetched again.
+    """
+    progress = progress or (lambda message: None)
+
+    # Walk the range a day at a time, so memory stays bounded however long
+    # it is, and combine the daily aggregates into running totals
+    chunks = day_chunks(start_date, end_date)
+    logger.info(f"Computing temporal means and time series over {len(chunks)} days...")
+    progress(f"Fetching {len(chunks)} days of TEMPO data")
+    totals = {}
+    chunk_executor = ThreadPoolExecutor(max_workers=RANGE_CHUNK_WORKERS, thread_name_prefix="range-chunk")
+    try:
+        chunk_aggregates = chunk_executor.map(
+            lambda chunk: fetch_chunk_aggregates(lat_bounds, lon_bounds, *chunk, serve_stale),
+            chunks
         )
-        
-        # Merge datasets
-        logger.info(f"  Merging {product_name} datasets...")
-        result_merged = xr.merge([result_root, result_product, result_geolocation])
-        
-        # Subset by location
-        logger.info(f"  Subsetting {product_name} by location and quality...")
-        subset_ds = result_merged.sel(
-            {
-                "longitude": slice(lon_bounds[0], lon_bounds[1]),
-                "latitude": slice(lat_bounds[0], lat_bounds[1]),
-            }
-        ).where(result_merged["main_data_quality_flag"] == 0)
-        
-        logger.info(f"  {product_name} subset complete. Data shape: {subset_ds.dims}")
-        all_datasets[product_name] = subset_ds
-    
-    if len(all_datasets) == 0:
-        logger.warning("No datasets found for any product")
+        for done, aggregates in enumerate(chunk_aggregates, start=1):
+            combine_aggregates(totals, aggregates)
+            progress(f"Aggregated day {done}/{len(chunks)}")
+    finally:
+        chunk_executor.shutdown(wait=False, cancel_futures=True)
+
+    if len(totals) == 0:
+        logger.warning("No valid data found for any day of the range")
         return None
+
+    reduced = finalize_aggregates(totals)
+
+    product_data = {}
+    pyramids = {}
+    for product_name, grid in reduced.items():
+        stats = summarize_grid(grid['mean_column'])
+        product_data[product_name] = {
+            'temporal_mean': stats['mean'],
+            'temporal_min': stats['min'],
+            'temporal_max': stats['max'],
+            'data_points': grid['data_points'],
+            'time_series': grid['time_series'],
+            'units': PRODUCTS[product_name]['units']
+        }
+
+        pyramids[product_name] = build_pyramid(grid['mean_column'])
+    
+    # Prepare response
+    response_data = {
+        'latitude': lat,
+        'longitude': lon,
+        'radius_km': 10,
+        'start_date': start_date_str,
+        'end_date': end_date_str,
+        'products': product_data
+    }
     
-    return all_datasets
+    # Cache the response, and render map_data from the cached grids like hits
+    progress("Caching result")
+    cached = cache_response(cache_key, response_data, reduced, pyramids, expiry=cache_expiry_for_window(end_date))
+    
+    return render_cached_response(cached, map_format, lod)
+
+def run_job(job_id):
+    """
+    Run a queued job and store its result. Called by the run_jobs workers.
 
-def extract_map_data(data_array):
-    """Extract map data as 3D array with [longitude, latitude, quantity] format"""
-    # Get the data values and coordinates
-    data_values = data_array.values
-    lat_coords = data_array.coords['latitude'].values
-    lon_coords = data_array.coords['longitude'].values
+    Failures are recorded on the job instead of being raised.
+    """
+    job = job_store.get(job_id)
+    if job is None:
+        logger.warning(f"Job {job_id} expired before it ran")
+        return
     
-    # Create a 3D array: each element is [longitude, latitude, quantity]
-    result = []
+    handler = JOB_HANDLERS.get(job['kind'])
+    if handler is None:
+        job_store.fail(job_id, f"Unknown job kind: {job['kind']}")
+        return
     
-    # Iterate through the data array
-    # Handle both 1D and 2D data arrays
-    if len(data_values.shape) == 1:
-        # 1D array - single dimension (either lat or lon)
-        for i, val in enumerate(data_values):
-            if i < len(lat_coords) and i < len(lon_coords):
-                lon = float(lon_coords[i]) if i < len(lon_coords) else float(lon_coords[0])
-                lat = float(lat_coords[i]) if i < len(lat_coords) else float(lat_coords[0])
-                quantity = None if np.isnan(val) else float(val)
-                result.append([lon, lat, quantity])
-    else:
-        # 2D array - lat x lon grid
-        for i, lat in enumerate(lat_coords):
-            for j, lon in enumerate(lon_coords):
-                # Access the data value at this grid point
-                if i < data_values.shape[0] and j < data_values.shape[1]:
-                    val = data_values[i, j]
-                    quantity = None if np.isnan(val) else float(val)
-                    result.append([float(lon), float(lat), quantity])
+    logger.info(f"Running {job['kind']} job {job_id}")
+    job_store.update(job_id, status=jobs.STATUS_RUNNING)
+    try:
+        result = handler(job['params'], progress=lambda message: job_store.update(job_id, progress=message))
+    except Exception as e:
+        logger.error(f"Error in job {job_id}: {e}", exc_info=True)
+        job_store.fail(job_id, str(e))
+        return
     
-    return result
+    if result is None:
+        job_store.fail(job_id, 'No data found for the specified parameters')
+    else:
+        job_store.complete(job_id, result)
+
+def run_range_job(params, progress):
+    """Compute a get_data_range response for a job"""
+    return range_response(parse_range_params(params), progress=progress)
+
+# Job kinds and the functions computing their results
+JOB_HANDLERS = {
+    'data_range': run_range_job,
+}
+
+def job_status(job_id, job):
+    """Public status of a job"""
+    status_data = {
+        'job_id': job_id,
+        'kind': job['kind'],
+        'status': job['status'],
+        'progress': job['progress'] or None,
+        'created_at': datetime.fromtimestamp(job['created_at'], timezone.utc).isoformat(),
+        'updated_at': datetime.fromtimestamp(job['updated_at'], timezone.utc).isoformat(),
+    }
+    if job['status'] == jobs.STATUS_FAILED:
+        status_data['error'] = job['error']
+    return status_data
 
 # --- API Endpoints ---
 
+async def run_blocking(func, *args):
+    """
+    Run blocking xarray/earthaccess work on the bounded request pool.
+
+    Keeps the event loop free, so one process can have many slow NASA
+    fetches in flight while it still answers cheap requests.
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(request_executor, functools.partial(func, *args))
+
 @api_view(['GET'])
 @permission_classes([])
 def health_check(request):
     """Health check endpoint"""
     return JsonResponse({
         'status': 'healthy',
-        'redis_connected': cache is not None and cache.ping(),
-        'earthdata_authenticated': auth.authenticated
+        'redis_connected': cache.ping(),
+        'earthdata_authenticated': earthdata_session.authenticated
     })
 
-@api_view(['GET'])
-@permission_classes([])
-def get_current_map(request):
+def response_max_age(end_date, valid_until=None):
+    """
+    Seconds browsers and proxies may reuse a response about a window ending at end_date.
+
+    Past windows never change and are kept as long as the server cache
+    keeps them; valid_until can bound this, e.g. for URLs whose window
+    rolls over. Returns None for windows reaching today, which must be
+    revalidated.
+    """
+    if window_touches_today(end_date):
+        return None
+    max_age = CACHE_EXPIRY_PAST or HTTP_MAX_AGE_FOREVER
+    if valid_until is not None:
+        max_age = min(max_age, max(0, int((valid_until - datetime.now(timezone.utc)).total_seconds())))
+    return max_age
+
+def response_etag(*parts):
+    """Strong ETag of the parts identifying a response"""
+    digest = hashlib.sha256(json.dumps(parts, default=str).encode('utf-8')).hexdigest()
+    return f'"{digest[:32]}"'
+
+def patch_http_caching(response, etag, max_age):
+    """Set the validator and cache headers of a map response"""
+    response['ETag'] = etag
+    if max_age is None:
+        patch_cache_control(response, public=True, no_cache=True)
+    else:
+        patch_cache_control(response, public=True, max_age=max_age)
+    patch_vary_headers(response, ['Accept'])
+    return response
+
+def conditional_response(request, respond, etag_parts, max_age):
+    """
+    Serve the response built by respond with HTTP validators and cache headers.
+
+    For windows that can't change (max_age is not None) the ETag is derived
+    from etag_parts, which must identify the response, together with the
+    TEMPO collection and response versions. It is checked before respond
+    runs, so revalidations never touch the cache. Other windows get an ETag
+    of the rendered content. Matching conditional requests get a 304 Not
+    Modified, and error responses are returned as they are.
+    """
+    etag = None
+    if max_age is not None:
+        etag = response_etag(TEMPO_VERSION, MAP_RESPONSE_VERSION, *etag_parts)
+        not_modified = get_conditional_response(request, etag=etag)
+        if not_modified is not None:
+            return patch_http_caching(not_modified, etag, max_age)
+    
+    response = respond()
+    if response.status_code != 200:
+        return response
+    
+    if etag is None:
+        etag = response_etag(hashlib.sha256(response.content).hexdigest())
+        response = get_conditional_response(request, etag=etag, response=response)
+    return patch_http_caching(response, etag, max_age)
+
+@require_GET
+async def get_current_map(request):
     """
     Get a map of NO2 data for a 10km radius around given coordinates for the current day.
     
     Query parameters:
     - lat: Latitude (required)
     - lon: Longitude (required)
+    - format: map_data format, triples (default) or grid
+    - max_points, zoom: level of detail of map_data (optional)
+    
+    The response is JSON, MessagePack or an Arrow stream depending on the
+    Accept header.
     """
+    media_type = negotiation.select_media_type(request.headers.get('Accept'))
+    return await run_blocking(current_map_response, request, media_type)
+
+def current_map_response(request, media_type=negotiation.MEDIA_JSON):
+    """Handle a get_current_map request. Blocking, runs on the request pool."""
     try:
-        lat_str = request.GET.get('lat')
-        lon_str = request.GET.get('lon')
+        params = request.GET
+        lat_str = params.get('lat')
+        lon_str = params.get('lon')
         
         if lat_str is None or lon_str is None:
             return JsonResponse({'error': 'lat and lon parameters are required'}, status=400)
@@ -625,271 +2243,556 @@ def get_current_map(request):
         if not (-180 <= lon <= 180):
             return JsonResponse({'error': 'lon must be between -180 and 180'}, status=400)
         
-        # Define time range: from this day a year ago
-        now = datetime.now(timezone.utc)
-        start_date = now - timedelta(days=365)
-        end_date = now - timedelta(days=364)
+        try:
+            map_format = render_format(parse_map_format(params.get('format')), media_type)
+            lod = parse_lod_params(params)
+        except ValueError as e:
+            return JsonResponse({'error': str(e)}, status=400)
+        
+        # Define time range: this day a year ago
+        start_date, end_date = current_map_window()
         
         # Calculate bounds
         lat_bounds, lon_bounds = lat_lon_to_bounds(lat, lon, radius_km=10)
         
         # Generate cache key (using date only, without time)
-        cache_params = {
-            'lat': lat,
-            'lon': lon,
-            'start': start_date.strftime("%Y-%m-%d"),
-            'end': end_date.strftime("%Y-%m-%d"),
-            'endpoint': 'current_map'
-        }
-        cache_key = generate_cache_key(cache_params)
-        
-        # Check cache
-        cached_data = get_from_cache(cache_key)
-        if cached_data:
-            return jsonify(cached_data)
-        
-        # Fetch data
-        logger.info(f"Fetching data for lat={lat}, lon={lon}, date range={start_date} to {end_date}")
-        all_datasets = fetch_tempo_data(
-            lat_bounds, lon_bounds,
-            start_date.strftime("%Y-%m-%d %H:%M"),
-            end_date.strftime("%Y-%m-%d %H:%M")
-        )
+        cache_key = current_map_cache_key(lat, lon, start_date, end_date)
         
-        if all_datasets is None or len(all_datasets) == 0:
-            return JsonResponse({'error': 'No data found for the specified parameters'}, status=404)
+        def build(map_format=MAP_FORMAT_TRIPLES, lod=None, serve_stale=True):
+            return build_current_map_response(
+                cache_key, lat, lon, lat_bounds, lon_bounds, start_date, end_date,
+                map_format=map_format, lod=lod, serve_stale=serve_stale
+            )
         
-        # Process each product
-        logger.info("Computing temporal means for all products...")
-        product_data = {}
-        
-        for product_name, subset_ds in all_datasets.items():
-            logger.info(f"Processing {product_name}...")
-            temporal_mean_ds = subset_ds.mean(dim="time")
+        def respond():
+            # Check cache, refreshing stale entries in the background
+            cached_data = get_cached_response(cache_key, refresh=build, map_format=map_format, lod=lod)
+            if cached_data:
+                return negotiation.render(cached_data, media_type)
             
-            # Get the appropriate variable name for each product
-            if product_name == "NO2":
-                var_name = "vertical_column_troposphere"
-            elif product_name == "HCHO":
-                var_name = "vertical_column"
-            elif product_name == "O3":
-                var_name = "vertical_column_troposphere"
-            else:
-                continue
+            # Fetch data
+            logger.info(f"Fetching data for lat={lat}, lon={lon}, date range={start_date} to {end_date}")
+            response_data = build(map_format, lod)
             
-            if var_name in temporal_mean_ds:
-                mean_column = temporal_mean_ds[var_name].compute()
-                
-                product_data[product_name] = {
-                    'mean_value': float(mean_column.mean().values),
-                    'min_value': float(mean_column.min().values),
-                    'max_value': float(mean_column.max().values),
-                    'data_points': int(subset_ds.sizes.get('time', 0)),
-                    'units': 'molecules/cm^2'
-                }
+            if response_data is None:
+                return JsonResponse({'error': 'No data found for the specified parameters'}, status=404)
+            
+            return negotiation.render(response_data, media_type)
         
-        if len(product_data) == 0:
-            return JsonResponse({'error': 'No valid data variables found in datasets'}, status=404)
+        # The window of this URL rolls over at the next UTC midnight
+        rollover = start_date + timedelta(days=366)
+        return conditional_response(
+            request, respond, (cache_key, map_format, lod, media_type),
+            response_max_age(end_date, valid_until=rollover)
+        )
         
-        # Extract map data for all products
-        map_data = {}
-        for product_name, dataset in all_datasets.items():
-            logger.info(f"Extracting map data for {product_name}...")
-            temporal_mean_ds = dataset.mean(dim="time")
+    except TempoFetchError as e:
+        logger.warning(f"TEMPO unavailable in get_current_map: {e}")
+        return JsonResponse({'error': str(e)}, status=503)
+    except Exception as e:
+        logger.error(f"Error in get_current_map: {e}", exc_info=True)
+        return JsonResponse({'error': str(e)}, status=500)
+
+@csrf_exempt
+@require_POST
+async def get_map_batch(request):
+    """
+    Get the current map data of many locations at once.
+    
+    Body (JSON), at least one of:
+    - points: list of {"lat": ..., "lon": ...}
+    - site_ids: list of site ids (requires a token)
+    and optionally format: map_data format, triples (default) or grid, and
+    max_points, zoom: level of detail of map_data
+    """
+    try:
+        body = parse_body(request)
+        # Tokens and sites are looked up by Django's own sync thread, which
+        # closes its database connections; the request pool threads don't
+        locations = await sync_to_async(parse_batch_locations)(request, body)
+        map_format = parse_map_format(body.get('format'))
+        lod = parse_lod_params(body)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    except AuthenticationFailed as e:
+        return JsonResponse({'error': str(e.detail)}, status=401)
+    except Exception as e:
+        logger.error(f"Error in get_map_batch: {e}", exc_info=True)
+        return JsonResponse({'error': str(e)}, status=500)
+    return await run_blocking(map_batch_response, locations, map_format, lod)
+
+def parse_batch_locations(request, body):
+    """
+    Collect the locations of a batch map request.
+
+    Returns a list of dicts with the latitude, longitude and, for sites, the
+    site_id of each location. Raises ValueError with a message for the
+    client if the body is invalid, or AuthenticationFailed.
+    """
+    if not isinstance(body, dict):
+        raise ValueError('The body must be a JSON object')
+    points = body.get('points') or []
+    site_ids = body.get('site_ids') or []
+    if not isinstance(points, list) or not isinstance(site_ids, list):
+        raise ValueError('points and site_ids must be lists')
+    if len(points) == 0 and len(site_ids) == 0:
+        raise ValueError('points or site_ids is required')
+    if len(points) + len(site_ids) > MAP_BATCH_MAX_LOCATIONS:
+        raise ValueError(f'At most {MAP_BATCH_MAX_LOCATIONS} locations can be requested at once')
+    
+    locations = []
+    for point in points:
+        try:
+            lat = float(point['lat'])
+            lon = float(point['lon'])
+        except (KeyError, TypeError, ValueError):
+            raise ValueError('Each point needs numeric lat and lon')
+        if not (-90 <= lat <= 90) or not (-180 <= lon <= 180):
+            raise ValueError('lat must be between -90 and 90 and lon between -180 and 180')
+        locations.append({'latitude': lat, 'longitude': lon})
+    
+    if site_ids:
+        if TokenAuthentication().authenticate(request) is None:
+            raise AuthenticationFailed('Authentication is required for site_ids')
+        try:
+            site_ids = [int(site_id) for site_id in site_ids]
+        except (TypeError, ValueError):
+            raise ValueError('site_ids must be integers')
+        sites = Site.objects.select_related('region').in_bulk(site_ids)
+        unknown = [site_id for site_id in site_ids if site_id not in sites]
+        if unknown:
+            raise ValueError(f'Unknown site ids: {unknown}')
+        for site_id in site_ids:
+            region = sites[site_id].region
+            locations.append({'site_id': site_id, 'latitude': region.lat, 'longitude': region.lon})
+    
+    return locations
+
+def map_batch_response(locations, map_format=MAP_FORMAT_TRIPLES, lod=None):
+    """
+    Handle a get_map_batch request for parsed locations. Blocking, runs on
+    the request pool.
+
+    Locations are first looked up in the response cache. The tiles of all
+    the others are loaded together, so each product's granules are opened
+    once for the batch and every location is cut from the shared grids.
+    """
+    try:
+        start_date, end_date = current_map_window()
+        results = [None] * len(locations)
+        pending = []
+        for index, location in enumerate(locations):
+            lat, lon = location['latitude'], location['longitude']
+            lat_bounds, lon_bounds = lat_lon_to_bounds(lat, lon, radius_km=10)
+            cache_key = current_map_cache_key(lat, lon, start_date, end_date)
+            build_args = (cache_key, lat, lon, lat_bounds, lon_bounds, start_date, end_date)
             
-            # Get the appropriate variable name for each product
-            if product_name == "NO2":
-                var_name = "vertical_column_troposphere"
-            elif product_name == "HCHO":
-                var_name = "vertical_column"
-            elif product_name == "O3":
-                var_name = "vertical_column_troposphere"
+            # Check cache, refreshing stale entries in the background
+            cached_data = get_cached_response(
+                cache_key, refresh=functools.partial(build_current_map_response, *build_args),
+                map_format=map_format, lod=lod
+            )
+            if cached_data:
+                results[index] = cached_data
             else:
-                continue
-            
-            if var_name in temporal_mean_ds:
-                mean_column = temporal_mean_ds[var_name].compute()
-                map_data[product_name] = extract_map_data(mean_column)
-                logger.info(f"Map data extracted successfully for {product_name}")
+                pending.append((index, build_args))
         
-        # Prepare response
-        response_data = {
-            'latitude': lat,
-            'longitude': lon,
-            'radius_km': 10,
-            'start_date': start_date.isoformat(),
-            'end_date': end_date.isoformat(),
-            'map_data': map_data,
-            'products': product_data
-        }
+        if pending:
+            tiles = sorted({
+                tile for _, build_args in pending for tile in tiles_for_bounds(build_args[3], build_args[4])
+            })
+            logger.info(f"Fetching {len(pending)} of {len(locations)} locations from {len(tiles)} tiles")
+            tile_data = load_tiles(
+                tiles, start_date.strftime("%Y-%m-%d %H:%M"), end_date.strftime("%Y-%m-%d %H:%M")
+            )
+            for index, build_args in pending:
+                results[index] = build_current_map_response(
+                    *build_args, tile_data=tile_data, map_format=map_format, lod=lod
+                ) or {
+                    'latitude': build_args[1],
+                    'longitude': build_args[2],
+                    'error': 'No data found for the specified parameters',
+                }
         
-        # Cache the response
-        save_to_cache(cache_key, response_data)
+        for location, result in zip(locations, results):
+            if 'site_id' in location:
+                result['site_id'] = location['site_id']
         
-        return JsonResponse(response_data)
+        return JsonResponse({
+            'start_date': start_date.isoformat(),
+            'end_date': end_date.isoformat(),
+            'results': results,
+        })
         
+    except TempoFetchError as e:
+        logger.warning(f"TEMPO unavailable in get_map_batch: {e}")
+        return JsonResponse({'error': str(e)}, status=503)
     except Exception as e:
-        logger.error(f"Error in get_current_map: {e}", exc_info=True)
+        logger.error(f"Error in get_map_batch: {e}", exc_info=True)
         return JsonResponse({'error': str(e)}, status=500)
 
-@api_view(['GET'])
-@permission_classes([])
-def get_data_range(request):
+@require_GET
+async def get_map_tile(request, product, date, z, x, y):
     """
-    Get NO2 data for a 10km radius around given coordinates for a date range.
+    Get a PNG map tile of a product for a UTC day.
+    
+    Path parameters:
+    - product: Product name, e.g. NO2
+    - date: Day in ISO format YYYY-MM-DD
+    - z, x, y: Web mercator tile coordinates
     
     Query parameters:
-    - lat: Latitude (required)
-    - lon: Longitude (required)
-    - start_date: Start date in ISO format YYYY-MM-DD (required)
-    - end_date: End date in ISO format YYYY-MM-DD (required)
+    - vmin, vmax: Values at the ends of the color scale (optional,
+      defaults from the product registry)
     """
+    return await run_blocking(map_tile_response, request.GET, product, date, z, x, y)
+
+def map_tile_cache_key(product_name, day, z, x, y, vmin, vmax):
+    """Cache key of a rendered map tile"""
+    return generate_cache_key({
+        'product': product_name,
+        'day': day.strftime("%Y-%m-%d"),
+        'z': z,
+        'x': x,
+        'y': y,
+        'vmin': vmin,
+        'vmax': vmax,
+        'endpoint': 'map_tile'
+    })
+
+def build_map_tile(cache_key, product_name, day, z, x, y, vmin, vmax):
+    """
+    Render and cache a map tile from the tile cache of its day.
+
+    The window of a day is the one of get_current_map, so both share the
+    cached 0.5 degree tiles. Returns the PNG bytes. A transparent tile is
+    only cached when its day genuinely has no data: if a product could not
+    be fetched, load_tiles raises TempoFetchError before anything is saved.
+    """
+    start_str, end_str = day_window(day)
+    lat_bounds, lon_bounds = maptiles.tile_bounds(z, x, y)
+    # Pad the bounds so edge pixels find their nearest cell
+    lat_bounds = (lat_bounds[0] - MAP_TILE_PADDING, lat_bounds[1] + MAP_TILE_PADDING)
+    lon_bounds = (lon_bounds[0] - MAP_TILE_PADDING, lon_bounds[1] + MAP_TILE_PADDING)
+    
+    reduced = products_from_tiles(
+        load_tiles(tiles_for_bounds(lat_bounds, lon_bounds), start_str, end_str),
+        lat_bounds, lon_bounds
+    )
+    grid = reduced.get(product_name)
+    png = maptiles.render_tile(grid['mean_column'] if grid else None, z, x, y, vmin, vmax)
+    
+    save_to_cache(
+        cache_key, {'png': np.frombuffer(png, dtype=np.uint8)}, expiry=cache_expiry_for_window(end_str)
+    )
+    if map_tile_store is not None and not window_touches_today(end_str):
+        # Tiles of past days never change, so disk copies never expire
+        map_tile_store.put(cache_key, 0, png)
+    return png
+
+def get_map_tile_png(cache_key, product_name, day, z, x, y, vmin, vmax):
+    """PNG bytes of a map tile from the disk or Redis cache, rendering it on a miss"""
+    if map_tile_store is not None:
+        png = map_tile_store.get(cache_key, 0)
+        if png is not None:
+            return png
+    
+    build = functools.partial(build_map_tile, cache_key, product_name, day, z, x, y, vmin, vmax)
+    cached_data, stale = get_cache_entry(cache_key)
+    if cached_data:
+        if stale:
+            refresh_in_background(cache_key, build)
+        return cached_data['png'].tobytes()
+    return build()
+
+def map_tile_response(params, product, date, z, x, y):
+    """Handle a get_map_tile request. Blocking, runs on the request pool."""
     try:
-        lat_str = request.GET.get('lat')
-        lon_str = request.GET.get('lon')
-        start_date_str = request.GET.get('start_date')
-        end_date_str = request.GET.get('end_date')
-        
-        if lat_str is None or lon_str is None or start_date_str is None or end_date_str is None:
-            return JsonResponse({'error': 'lat, lon, start_date, and end_date parameters are required'}, status=400)
+        if product not in PRODUCTS:
+            return JsonResponse({'error': f"Unknown product. Use one of: {', '.join(PRODUCTS)}"}, status=404)
         
         try:
-            lat = float(lat_str)
-            lon = float(lon_str)
+            day = datetime.strptime(date, "%Y-%m-%d").replace(tzinfo=timezone.utc)
         except ValueError:
-            return JsonResponse({'error': 'lat and lon must be valid numbers'}, status=400)
-        
-        if not (-90 <= lat <= 90):
-            return JsonResponse({'error': 'lat must be between -90 and 90'}, status=400)
+            return JsonResponse({'error': 'Invalid date format. Use YYYY-MM-DD'}, status=400)
         
-        if not (-180 <= lon <= 180):
-            return JsonResponse({'error': 'lon must be between -180 and 180'}, status=400)
+        if not (MAP_TILE_MIN_ZOOM <= z <= MAP_TILE_MAX_ZOOM):
+            return JsonResponse(
+                {'error': f'z must be between {MAP_TILE_MIN_ZOOM} and {MAP_TILE_MAX_ZOOM}'}, status=404
+            )
+        if not (0 <= x < 2 ** z and 0 <= y < 2 ** z):
+            return JsonResponse({'error': 'x and y must be between 0 and 2^z - 1'}, status=404)
         
-        # Parse dates
+        vmin, vmax = PRODUCTS[product]['color_range']
         try:
-            start_date = datetime.fromisoformat(start_date_str)
-            end_date = datetime.fromisoformat(end_date_str)
+            vmin = float(params.get('vmin', vmin))
+            vmax = float(params.get('vmax', vmax))
         except ValueError:
-            return JsonResponse({'error': 'Invalid date format. Use ISO format YYYY-MM-DD or YYYY-MM-DDTHH:MM:SS'}, status=400)
-        
-        if start_date > end_date:
-            return JsonResponse({'error': 'start_date must be before end_date'}, status=400)
-        
-        # Calculate bounds
-        lat_bounds, lon_bounds = lat_lon_to_bounds(lat, lon, radius_km=10)
-        
-        # Generate cache key (using date only, without time)
-        cache_params = {
-            'lat': lat,
-            'lon': lon,
-            'start': start_date.strftime("%Y-%m-%d"),
-            'end': end_date.strftime("%Y-%m-%d"),
-            'endpoint': 'data_range'
-        }
-        cache_key = generate_cache_key(cache_params)
+            return JsonResponse({'error': 'vmin and vmax must be valid numbers'}, status=400)
+        if not vmin < vmax:
+            return JsonResponse({'error': 'vmin must be less than vmax'}, status=400)
         
-        # Check cache
-        cached_data = get_from_cache(cache_key)
-        if cached_data:
-            return jsonify(cached_data)
+        cache_key = map_tile_cache_key(product, day, z, x, y, vmin, vmax)
+        png = get_map_tile_png(cache_key, product, day, z, x, y, vmin, vmax)
         
-        # Fetch data
-        logger.info(f"Fetching data for lat={lat}, lon={lon}, date range={start_date} to {end_date}")
-        all_datasets = fetch_tempo_data(
-            lat_bounds, lon_bounds,
-            start_date.strftime("%Y-%m-%d %H:%M"),
-            end_date.strftime("%Y-%m-%d %H:%M")
+        response = HttpResponse(png, content_type='image/png')
+        # Past days never change, let browsers keep them as long as the cache
+        _, end_str = day_window(day)
+        patch_cache_control(
+            response, public=True, max_age=cache_expiry_for_window(end_str) or HTTP_MAX_AGE_FOREVER
         )
+        return response
         
-        if all_datasets is None or len(all_datasets) == 0:
-            return jsonify({'error': 'No data found for the specified parameters'}), 404
-        
-        # Process each product
-        logger.info("Computing temporal means and time series for all products...")
-        product_data = {}
-        
-        for product_name, subset_ds in all_datasets.items():
-            logger.info(f"Processing {product_name}...")
-            
-            # Get the appropriate variable name for each product
-            if product_name == "NO2":
-                var_name = "vertical_column_troposphere"
-            elif product_name == "HCHO":
-                var_name = "vertical_column"
-            elif product_name == "O3":
-                var_name = "vertical_column_troposphere"
-            else:
-                continue
-            
-            if var_name not in subset_ds:
-                logger.warning(f"Variable {var_name} not found in {product_name} dataset")
-                continue
-            
-            # Calculate temporal mean
-            temporal_mean_ds = subset_ds.mean(dim="time")
-            mean_column = temporal_mean_ds[var_name].compute()
-            
-            # Extract time series data
-            time_series_data = []
-            if 'time' in subset_ds.dims:
-                for t in subset_ds.time.values:
-                    time_slice = subset_ds.sel(time=t)[var_name].compute()
-                    time_series_data.append({
-                        'time': str(t),
-                        'mean_value': float(time_slice.mean().values),
-                        'min_value': float(time_slice.min().values),
-                        'max_value': float(time_slice.max().values)
-                    })
-            
-            product_data[product_name] = {
-                'temporal_mean': float(mean_column.mean().values),
-                'temporal_min': float(mean_column.min().values),
-                'temporal_max': float(mean_column.max().values),
-                'data_points': int(subset_ds.sizes.get('time', 0)),
-                'time_series': time_series_data,
-                'units': 'molecules/cm^2'
-            }
-        
-        if len(product_data) == 0:
-            return jsonify({'error': 'No valid data variables found in datasets'}), 404
+    except TempoFetchError as e:
+        logger.warning(f"TEMPO unavailable in get_map_tile: {e}")
+        return JsonResponse({'error': str(e)}, status=503)
+    except Exception as e:
+        logger.error(f"Error in get_map_tile: {e}", exc_info=True)
+        return JsonResponse({'error': str(e)}, status=500)
+
+@require_GET
+async def get_data_range(request):
+    """
+    Get NO2 data for a 10km radius around given coordinates for a date range.
+    
+    Query parameters:
+    - lat: Latitude (required)
+    - lon: Longitude (required)
+    - start_date: Start date in ISO format YYYY-MM-DD (required)
+    - end_date: End date in ISO format YYYY-MM-DD (required)
+    - format: map_data format, triples (default) or grid
+    - max_points, zoom: level of detail of map_data (optional)
+    
+    The response is JSON, MessagePack or an Arrow stream depending on the
+    Accept header.
+    """
+    media_type = negotiation.select_media_type(request.headers.get('Accept'))
+    return await run_blocking(data_range_response, request, media_type)
+
+def parse_range_params(params):
+    """
+    Validate the parameters of a date range request.
+
+    Raises ValueError with a message for the client if they are invalid.
+    """
+    lat_str = params.get('lat')
+    lon_str = params.get('lon')
+    start_date_str = params.get('start_date')
+    end_date_str = params.get('end_date')
+    
+    if lat_str is None or lon_str is None or start_date_str is None or end_date_str is None:
+        raise ValueError('lat, lon, start_date, and end_date parameters are required')
+    
+    try:
+        lat = float(lat_str)
+        lon = float(lon_str)
+    except (TypeError, ValueError):
+        raise ValueError('lat and lon must be valid numbers')
+    
+    if not (-90 <= lat <= 90):
+        raise ValueError('lat must be between -90 and 90')
+    
+    if not (-180 <= lon <= 180):
+        raise ValueError('lon must be between -180 and 180')
+    
+    # Parse dates
+    try:
+        start_date = datetime.fromisoformat(start_date_str)
+        end_date = datetime.fromisoformat(end_date_str)
+    except (TypeError, ValueError):
+        raise ValueError('Invalid date format. Use ISO format YYYY-MM-DD or YYYY-MM-DDTHH:MM:SS')
+    
+    if start_date > end_date:
+        raise ValueError('start_date must be before end_date')
+    
+    map_format = parse_map_format(params.get('format'))
+    lod = parse_lod_params(params)
+    
+    return {
+        'lat': lat,
+        'lon': lon,
+        'start_date': start_date,
+        'end_date': end_date,
+        'start_date_str': start_date_str,
+        'end_date_str': end_date_str,
+        'map_format': map_format,
+        'lod': lod,
+    }
+
+def range_cache_key(lat, lon, start_date, end_date):
+    """Cache key of a get_data_range response (using date only, without time)"""
+    cache_params = {
+        'lat': lat,
+        'lon': lon,
+        'start': start_date.strftime("%Y-%m-%d"),
+        'end': end_date.strftime("%Y-%m-%d"),
+        'endpoint': 'data_range'
+    }
+    return generate_cache_key(cache_params)
+
+def range_response(query, progress=None):
+    """
+    Cached or freshly built response for validated date range parameters.
+
+    Returns None if no data was found. progress, if given, is called with a
+    short message at each step of a fetch.
+    """
+    lat, lon = query['lat'], query['lon']
+    start_date, end_date = query['start_date'], query['end_date']
+    
+    # Calculate bounds
+    lat_bounds, lon_bounds = lat_lon_to_bounds(lat, lon, radius_km=10)
+    cache_key = range_cache_key(lat, lon, start_date, end_date)
+    
+    map_format, lod = query['map_format'], query['lod']
+    
+    def build(progress=None, map_format=MAP_FORMAT_TRIPLES, lod=None, serve_stale=True):
+        return build_range_response(
+            cache_key, lat, lon, lat_bounds, lon_bounds,
+            start_date, end_date, query['start_date_str'], query['end_date_str'],
+            progress=progress, map_format=map_format, lod=lod, serve_stale=serve_stale
+        )
+    
+    # Check cache, refreshing stale entries in the background
+    cached_data = get_cached_response(cache_key, refresh=build, map_format=map_format, lod=lod)
+    if cached_data:
+        return cached_data
+    
+    # Fetch data, only once across workers for the same cache key
+    logger.info(f"Fetching data for lat={lat}, lon={lon}, date range={start_date} to {end_date}")
+    return single_flight(
+        cache_key,
+        lambda: get_cached_response(cache_key, map_format=map_format, lod=lod),
+        functools.partial(build, progress, map_format, lod)
+    )
+
+def data_range_response(request, media_type=negotiation.MEDIA_JSON):
+    """Handle a get_data_range request. Blocking, runs on the request pool."""
+    try:
+        try:
+            query = parse_range_params(request.GET)
+        except ValueError as e:
+            return JsonResponse({'error': str(e)}, status=400)
+        query['map_format'] = render_format(query['map_format'], media_type)
         
-        # Extract map data for all products
-        map_data = {}
-        for product_name, dataset in all_datasets.items():
-            logger.info(f"Extracting map data for {product_name}...")
-            temporal_mean_ds = dataset.mean(dim="time")
+        def respond():
+            response_data = range_response(query)
             
-            # Get the appropriate variable name for each product
-            if product_name == "NO2":
-                var_name = "vertical_column_troposphere"
-            elif product_name == "HCHO":
-                var_name = "vertical_column"
-            elif product_name == "O3":
-                var_name = "vertical_column_troposphere"
-            else:
-                continue
+            if response_data is None:
+                return JsonResponse({'error': 'No data found for the specified parameters'}, status=404)
             
-            if var_name in temporal_mean_ds:
-                mean_column = temporal_mean_ds[var_name].compute()
-                map_data[product_name] = extract_map_data(mean_column)
-                logger.info(f"Map data extracted successfully for {product_name}")
-        
-        # Prepare response
-        response_data = {
-            'latitude': lat,
-            'longitude': lon,
-            'radius_km': 10,
-            'start_date': start_date_str,
-            'end_date': end_date_str,
-            'map_data': map_data,
-            'products': product_data
-        }
+            return negotiation.render(response_data, media_type)
         
-        # Cache the response
-        save_to_cache(cache_key, response_data)
-        
-        return jsonify(response_data)
+        cache_key = range_cache_key(query['lat'], query['lon'], query['start_date'], query['end_date'])
+        return conditional_response(
+            request, respond,
+            (cache_key, query['start_date_str'], query['end_date_str'], query['map_format'], query['lod'], media_type),
+            response_max_age(query['end_date'])
+        )
         
+    except TempoFetchError as e:
+        logger.warning(f"TEMPO unavailable in get_data_range: {e}")
+        return JsonResponse({'error': str(e)}, status=503)
     except Exception as e:
         logger.error(f"Error in get_data_range: {e}", exc_info=True)
-        return jsonify({'error': str(e)}), 500
+        return JsonResponse({'error': str(e)}, status=500)
+
+@api_view(['POST'])
+@permission_classes([])
+def create_job(request):
+    """
+    Queue a date range request as a job, for ranges too long to fetch within a request.
+    
+    Body parameters (JSON or form), as for get_data_range:
+    - lat: Latitude (required)
+    - lon: Longitude (required)
+    - start_date: Start date in ISO format YYYY-MM-DD (required)
+    - end_date: End date in ISO format YYYY-MM-DD (required)
+    - format: map_data format, triples (default) or grid
+    - max_points, zoom: level of detail of map_data (optional)
+    """
+    if not isinstance(request.data, dict):
+        return JsonResponse({'error': 'The body must be a JSON object'}, status=400)
+    params = {
+        key: request.data.get(key)
+        for key in ('lat', 'lon', 'start_date', 'end_date', 'format', 'max_points', 'zoom')
+        if request.data.get(key) is not None
+    }
+    try:
+        parse_range_params(params)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    
+    try:
+        job_id = job_store.create('data_range', params)
+        job = job_store.get(job_id)
+    except redis.exceptions.RedisError as e:
+        logger.error(f"Error queueing job: {e}")
+        return JsonResponse({'error': 'The job queue is unavailable'}, status=503)
+    
+    response = JsonResponse(job_status(job_id, job), status=202)
+    response['Location'] = f"/api/jobs/{job_id}/"
+    return response
+
+@api_view(['GET'])
+@permission_classes([])
+def job_detail(request, job_id):
+    """Status of a job, with its result once it is done"""
+    try:
+        job = job_store.get(job_id)
+        result = job_store.get_result(job_id) if job and job['status'] == jobs.STATUS_DONE else None
+    except redis.exceptions.RedisError as e:
+        logger.error(f"Error reading job {job_id}: {e}")
+        return JsonResponse({'error': 'The job queue is unavailable'}, status=503)
+    
+    if job is None:
+        return JsonResponse({'error': 'Job not found'}, status=404)
+    
+    status_data = job_status(job_id, job)
+    if job['status'] == jobs.STATUS_DONE:
+        status_data['result'] = result
+    return JsonResponse(status_data)
+
+@require_GET
+async def job_events(request, job_id):
+    """
+    Stream the status of a job as server-sent events until it finishes.
+    
+    An event is sent on every change of status or progress. The result
+    itself is fetched from job_detail once the job is done.
+    """
+    try:
+        job = await run_blocking(job_store.get, job_id)
+    except redis.exceptions.RedisError as e:
+        logger.error(f"Error reading job {job_id}: {e}")
+        return JsonResponse({'error': 'The job queue is unavailable'}, status=503)
+    
+    if job is None:
+        return JsonResponse({'error': 'Job not found'}, status=404)
+    
+    async def events(job):
+        last_event = None
+        while True:
+            status_data = job_status(job_id, job)
+            event = (status_data['status'], status_data['progress'])
+            if event != last_event:
+                last_event = event
+                yield f"data: {json.dumps(status_data)}\n\n"
+            if job['status'] in jobs.FINISHED_STATUSES:
+                return
+            
+            await asyncio.sleep(JOB_EVENTS_POLL_INTERVAL)
+            try:
+                job = await run_blocking(job_store.get, job_id)
+            except redis.exceptions.RedisError as e:
+                logger.error(f"Error reading job {job_id}: {e}")
+                job = None
+            if job is None:
+                yield f"event: error\ndata: {json.dumps({'error': 'Job status unavailable'})}\n\n"
+                return
+    
+    response = StreamingHttpResponse(events(job), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    # Keep proxies from buffering the stream
+    response['X-Accel-Buffering'] = 'no'
+    return response
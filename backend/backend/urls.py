@@ -44,5 +44,10 @@ urlpatterns = [
     # NASA Earthdata API
     path("health/", views.health_check, name="health_check"),
     path("api/map/current/", views.get_current_map, name="get_current_map"),
+    path("api/map/batch/", views.get_map_batch, name="get_map_batch"),
+    path("api/tiles/<str:product>/<str:date>/<int:z>/<int:x>/<int:y>.png", views.get_map_tile, name="get_map_tile"),
     path("api/data/range/", views.get_data_range, name="get_data_range"),
+    path("api/jobs/", views.create_job, name="create_job"),
+    path("api/jobs/<str:job_id>/", views.job_detail, name="job_detail"),
+    path("api/jobs/<str:job_id>/events/", views.job_events, name="job_events"),
 ]
@@ -78,4 +78,5 @@ echo "Using port: $PORT"
 
 # Run the application
 echo "Starting the application..."
-exec python -m gunicorn backend.wsgi:application --bind "0.0.0.0:$PORT"
+# ASGI workers, so slow NASA fetches don't block the other requests
+exec python -m gunicorn backend.asgi:application -k uvicorn_worker.UvicornWorker --bind "0.0.0.0:$PORT"